@@ -0,0 +1,264 @@
+'''
+Process-pool helpers shared by the batch drivers (pdf_module, xml_module, svg_module)
+'''
+import os
+import json
+import time
+import functools
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from profile_module import timer, pop_stats, merge_stats
+
+class StageError(Exception):
+    '''
+        failure of one stage ('open', 'features', 'waves', ...) of the extraction of a file
+    '''
+    def __init__(self, stage, reason):
+        super().__init__(stage, reason)
+        self.stage = stage
+        self.reason = reason
+
+    def __str__(self):
+        return f'{self.stage}: {self.reason}'
+
+class Skipped(Exception):
+    '''
+        raised by the function of 'iter_records' to record an item with its own status (e.g. 'no_ecg_pages')
+        instead of 'ok', none_status or 'error'; the result of the item is None
+    '''
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+def describe(error):
+    '''
+        one line description of an exception, with the location it was raised at (useful for bare asserts)
+    '''
+    frame = traceback.extract_tb(error.__traceback__)[-1] if error.__traceback__ else None
+    reason = type(error).__name__ + (f': {error}' if str(error) else '')
+    if frame is not None:
+        reason += f' at {os.path.basename(frame.filename)}:{frame.lineno} ({frame.line})'
+    return reason
+
+@contextlib.contextmanager
+def stage(name):
+    '''
+        re-raises any exception of the block as a StageError of the given stage, and times the block (see profile_module.timer)
+    '''
+    try:
+        with timer(name):
+            yield
+    except StageError:
+        raise
+    except Exception as error:
+        raise StageError(name, describe(error)) from error
+
+def error_record(error):
+    '''
+        {'stage', 'reason'} of an exception raised while extracting a file
+    '''
+    if isinstance(error, StageError):
+        return {'stage': error.stage, 'reason': error.reason}
+    return {'stage': 'unknown', 'reason': describe(error)}
+
+def item_key(record):
+    '''
+        work item of a manifest record: the file, or (file, page) for page-level records
+    '''
+    return (record['file'], record['page']) if 'page' in record else record['file']
+
+def item_record(item):
+    '''
+        {'file'} of a path, {'file', 'page'} of a (path, page) work item
+    '''
+    if isinstance(item, tuple):
+        path, page = item
+        return {'file': path, 'page': page}
+    return {'file': item}
+
+def read_manifest(path):
+    '''
+        returns {item: record} of a manifest written by 'append_manifest' (the last record of each item wins),
+        items are files, or (file, page) for page-level records
+    '''
+    records = {}
+    if path is None or not os.path.exists(path):
+        return records
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records[item_key(record)] = record
+    return records
+
+def append_manifest(path, *records):
+    with open(path, 'a') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+def commit_manifest(path, pending):
+    '''
+        appends the manifest records held back by iter_records(pending=...) once the output of their items is saved
+        (see the on_flush argument of dataset_module.write_dataset and write_table), and empties pending
+    '''
+    if path is not None and pending:
+        append_manifest(path, *pending)
+    pending.clear()
+
+def is_done(done, item):
+    '''
+        whether item is recorded in done (from 'read_manifest') with another status than 'error'
+    '''
+    return done.get(item, {}).get('status', 'error') != 'error'
+
+def count_pending(paths, manifest):
+    '''
+        number of paths that a resumed 'iter_records' would process
+    '''
+    done = read_manifest(manifest)
+    return sum(1 for path in paths if not is_done(done, path))
+
+def chunked(items, chunksize):
+    '''
+        splits an iterable into lists of at most chunksize items
+    '''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _apply_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+def imap_bounded(func, items, workers=None, chunksize=1, max_in_flight=None, ordered=True):
+    '''
+        applies func to every item on a process pool and yields the results
+        - workers: number of processes (None: os.cpu_count())
+        - chunksize: number of items sent to a worker per task
+        - max_in_flight: maximum number of items submitted but not yet yielded (None: 4 chunks per worker)
+        - ordered: yield results in input order if True, as they complete otherwise
+        func must be picklable (i.e. defined at module level)
+    '''
+    workers = workers or os.cpu_count()
+    chunksize = max(1, chunksize)
+    if max_in_flight is None:
+        max_in_flight = 4 * workers * chunksize
+    max_chunks = max(1, max_in_flight // chunksize)
+
+    chunks = enumerate(chunked(items, chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}   # future -> chunk index
+        done_chunks = {}   # chunk index -> results, only used when ordered
+        next_idx = 0
+        exhausted = False
+
+        while True:
+            # keep at most max_chunks chunks in flight
+            while not exhausted and len(pending) + len(done_chunks) < max_chunks:
+                try:
+                    idx, chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(_apply_chunk, func, chunk)] = idx
+
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                idx = pending.pop(future)
+                if ordered:
+                    done_chunks[idx] = future.result()
+                else:
+                    yield from future.result()
+
+            while next_idx in done_chunks:
+                yield from done_chunks.pop(next_idx)
+                next_idx += 1
+
+def new_stats():
+    return {'files': 0, 'bytes': 0, 'seconds': 0, 'status': {}, 'failures': {}, 'stages': {}}
+
+def update_stats(stats, status, error, size, seconds, stage_stats):
+    '''
+        adds one file to stats: number of files and input bytes, extraction seconds, count of each status,
+        failures by stage, and the statistics of the stages and timers run for it (see profile_module.merge_stats)
+    '''
+    stats['files'] += 1
+    stats['bytes'] += size
+    stats['seconds'] += seconds
+    stats['status'][status] = stats['status'].get(status, 0) + 1
+    if error is not None:
+        stats['failures'][error['stage']] = stats['failures'].get(error['stage'], 0) + 1
+    merge_stats(stats['stages'], stage_stats)
+
+def _run_item(func, on_error, none_status, item):
+    index, path = item
+    record = item_record(path)
+    size = 0
+    pop_stats()
+    start = time.perf_counter()
+    try:
+        # the size of a file is only counted once for page-level items, with page 0 (or page None, see pdf_module.iter_pdf_pages)
+        if record.get('page') in (None, 0):
+            size = os.path.getsize(record['file'])
+        result = func(path)
+        status = 'ok' if result is not None else none_status
+    except Skipped as skipped:
+        result, status = None, skipped.status
+    except Exception as error:
+        if on_error != 'record':
+            raise
+        result, status = error_record(error), 'error'
+    seconds = time.perf_counter() - start
+    return index, path, status, result, size, seconds, pop_stats()
+
+def iter_records(func, paths, workers=1, chunksize=1, max_in_flight=None, ordered=True, on_error='raise',
+                 none_status='skipped', manifest=None, resume=False, stats=None, pending=None):
+    '''
+        applies func to every path and yields (path, status, result) where status is
+        'ok', none_status (func returned None), the status of a 'Skipped' raised by func (result is None)
+        or 'error' (only with on_error='record', result is the error record)
+        - workers, chunksize, max_in_flight, ordered: see 'imap_bounded' (workers=1 runs serially)
+        - on_error: 'raise' stops at the first failing file, 'record' yields an error record for it and goes on
+        - manifest: jsonl file to which {'file', 'index', 'status', 'stage', 'reason'} is appended for every file
+        - resume: skip the files recorded by a previous run in the manifest, unless their status is 'error'
+        - stats: dictionary from 'new_stats', updated as the files are processed (see 'update_stats')
+        - pending: list to which the manifest records of the 'ok' files are added instead of being written,
+          for the caller to write them with 'commit_manifest' once their output is saved,
+          so that the files of an interrupted run whose output was not saved yet are processed again by resume
+        paths is consumed lazily, func must be picklable when workers != 1
+        paths may also hold (path, page) items for page-level work, passed as is to func and recorded with their page
+    '''
+    items = enumerate(paths)
+    if resume:
+        done = read_manifest(manifest)
+        items = ((i, path) for i, path in items if not is_done(done, path))
+
+    run = functools.partial(_run_item, func, on_error, none_status)
+    if workers == 1:
+        records = map(run, items)
+    else:
+        records = imap_bounded(run, items, workers=workers, chunksize=chunksize,
+                               max_in_flight=max_in_flight, ordered=ordered)
+
+    for i, path, status, result, size, seconds, stage_stats in records:
+        error = result if status == 'error' else None
+        if manifest is not None:
+            record = dict(item_record(path), index=i, status=status)
+            if error is not None:
+                record.update(error)
+            if status == 'ok' and pending is not None:
+                pending.append(record)
+            else:
+                append_manifest(manifest, record)
+        if stats is not None:
+            update_stats(stats, status, error, size, seconds, stage_stats)
+        yield path, status, result
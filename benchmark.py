@@ -0,0 +1,254 @@
+'''
+Benchmarks for the hot paths and batch drivers of the extraction pipeline
+    usage: python benchmark.py [--files N] [--workers N] [benchmark ...]
+- inputs are synthetic (see synthetic_module), with known waves and features
+- every benchmark checks its output against the expected one (golden check) before timing it,
+  and the hot paths are also compared against their reference (original) implementation
+'''
+import os
+import time
+import base64
+import timeit
+import argparse
+import tempfile
+import tracemalloc
+import fitz
+import numpy as np
+from parsing import parse_path, _parse_path, get_svg_data, has_rhythm_strip, LAYOUT_PROFILES
+from pdf_module import read_waves_pdf, get_values_pdf, extract_pdf, TARGET_FREQ, waves_and_features, page_waves_and_features, upsampling
+from resample_module import resample, resampling_operators
+from xml_module import bytearray_to_bitarray, bitarray_to_intarray, bytes_to_codes, LZW_decompress, LZW_decode, delta_decompression, delta_decode, XLI_decode, waves_and_headers_xml
+from synthetic_module import synthetic_page, synthetic_svg, synthetic_pdf, synthetic_multipage_pdf, synthetic_leads, synthetic_xli, expected_XLI_output, write_fixtures
+
+DRAWINGS_TOLERANCE = 1e-2   # the 'drawings' engine reads float32 page coordinates (see pdf_module.get_drawing_data)
+
+def best_time(func, *args, repeat=5, number=10):
+    '''
+        returns the best time (seconds) of a single call of func(*args)
+    '''
+    return min(timeit.repeat(lambda: func(*args), repeat=repeat, number=number)) / number
+
+def peak_memory(func, *args):
+    '''
+        peak memory (bytes) allocated by a single call of func(*args)
+    '''
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def report(name, reference_time, current_time):
+    print(f'{name:<40} reference {reference_time*1e3:9.3f} ms   current {current_time*1e3:9.3f} ms   speedup {reference_time/current_time:6.1f}x')
+
+def report_current(name, current_time, peak=None):
+    line = f'{name:<40} current {current_time*1e3:9.3f} ms'
+    if peak is not None:
+        line += f'   peak {peak / 1e6:8.2f} MB'
+    print(line)
+
+def same_waves(waves, expected, tolerance=0):
+    return len(waves) == len(expected) and all(
+        len(wave) == len(other) and np.allclose(wave, other, rtol=0, atol=tolerance) for wave, other in zip(waves, expected)
+    )
+
+def reference_parse_path(pathdef):
+    '''
+        'parse_path' without the polyline fast path
+    '''
+    verts = []
+    for c, v in _parse_path(pathdef, 0 + 0j):
+        verts.append(list(v[0]))
+    return np.array(verts)
+
+def synthetic_lead_path(n=5000, relative=False, seed=0):
+    '''
+        svg 'd' attribute of a lead-like polyline with n vertices
+    '''
+    rng = np.random.default_rng(seed)
+    x = 600 + 2 * np.arange(n)
+    y = 4000 + np.cumsum(rng.integers(-20, 21, n))
+    if relative:
+        x[1:], y[1:] = np.diff(x), np.diff(y)
+        command, line = 'm', 'l'
+    else:
+        command, line = 'M', 'L'
+    vertices = [f'{a} {b}' for a, b in zip(x, y)]
+    return f'{command} {vertices[0]} ' + ' '.join(f'{line} {v}' for v in vertices[1:])
+
+def bench_parse_path(n=5000):
+    for relative in (False, True):
+        pathdef = synthetic_lead_path(n, relative)
+        assert np.array_equal(parse_path(pathdef), reference_parse_path(pathdef))
+        report(f'parse_path ({n} vertices, {"relative" if relative else "absolute"})',
+               best_time(reference_parse_path, pathdef), best_time(parse_path, pathdef))
+
+def reference_bytes_to_codes(chunk, nr=10):
+    return bitarray_to_intarray(bytearray_to_bitarray(chunk), nr)
+
+def bench_bytes_to_codes():
+    chunk = base64.b64decode(synthetic_xli(1))[8:]
+    assert np.array_equal(bytes_to_codes(chunk), reference_bytes_to_codes(chunk))
+    report(f'bytes_to_codes ({len(chunk)} bytes)', best_time(reference_bytes_to_codes, chunk), best_time(bytes_to_codes, chunk))
+
+def reference_LZW_decode(codes):
+    '''
+        decompression loop of the original XLI_decode: drops trailing codes until the output has 11000 bytes
+    '''
+    cut_idx = 0
+    while True:
+        try:
+            decomp = LZW_decompress([chr(i) for i in codes[:len(codes) - cut_idx]], 256)
+            if len(decomp) == 11000:
+                return decomp
+        except ValueError:
+            pass
+        cut_idx += 1
+
+def bench_LZW_decode():
+    codes = bytes_to_codes(base64.b64decode(synthetic_xli(1))[8:])
+    codes = np.concatenate([codes, [0, 1023]]) # trailing padding codes
+    assert np.array_equal(LZW_decode(codes), reference_LZW_decode(codes))
+    report(f'LZW_decode ({len(codes)} codes)', best_time(reference_LZW_decode, codes, number=1), best_time(LZW_decode, codes))
+
+def bench_delta_decode():
+    deltas = np.random.default_rng(0).integers(0, 128, 5500).astype(np.int16)
+    first = np.int16(3)
+    with np.errstate(over='ignore'):
+        assert np.array_equal(delta_decode(deltas, first), np.array(delta_decompression(list(deltas), first), dtype=np.int16))
+        report('delta_decode (5500 samples)', best_time(delta_decompression, list(deltas), first, number=1), best_time(delta_decode, deltas, first))
+
+def bench_XLI_decode():
+    payload = synthetic_xli()
+    assert np.array_equal(XLI_decode(payload)[:12], expected_XLI_output(synthetic_leads())[:12])
+    report_current('XLI_decode (16 leads)', best_time(XLI_decode, payload, repeat=3, number=1), peak_memory(XLI_decode, payload))
+
+def bench_get_svg_data():
+    for profile in ('S_3x4+1_500', 'S_3x4+1_250', 'S_6x2_500', 'S_12x1_500'):
+        svg, expected = synthetic_svg(profile)
+        waves, freq = get_svg_data('auto', svg)
+        assert same_waves(waves, expected) and freq == int(profile.split('_')[-1])
+        report_current(f'get_svg_data ({profile}, {len(svg) / 1e6:.1f} MB)',
+                       best_time(get_svg_data, 'auto', svg, number=3), peak_memory(get_svg_data, 'auto', svg))
+
+def reference_resample(waves):
+    return [upsampling(lead, factor=2) for lead in waves]
+
+def bench_resample():
+    _, waves = synthetic_page('S_3x4+1_250')
+    assert same_waves(resample(waves, 250, 500), reference_resample(waves), 1e-9)
+    report('resample (13 leads, 250 -> 500 Hz)', best_time(reference_resample, waves), best_time(resample, waves, 250, 500))
+    report_current('resample (first call, operators built)', best_time(lambda: (resampling_operators.cache_clear(), resample(waves, 250, 500)), number=1))
+
+def svg_engine_supported(pdf):
+    '''
+        PyMuPDF >= 1.20 writes svg paths with implicit commands, which parsing.parse_path does not read
+    '''
+    try:
+        read_waves_pdf(pdf, 'svg')
+        return True
+    except ValueError:
+        return False
+
+def bench_read_waves_pdf(directory):
+    pdf = os.path.join(directory, 'waves.pdf')
+    expected, _ = synthetic_pdf(pdf)
+    for engine in ('svg', 'drawings'):
+        if engine == 'svg' and not svg_engine_supported(pdf):
+            print(f'{"read_waves_pdf (svg)":<40} skipped: svg output of PyMuPDF {fitz.VersionBind} not supported')
+            continue
+        waves, _ = read_waves_pdf(pdf, engine)
+        assert same_waves(waves, expected, DRAWINGS_TOLERANCE if engine == 'drawings' else 0)
+        report_current(f'read_waves_pdf ({engine})', best_time(read_waves_pdf, pdf, engine, number=3),
+                       peak_memory(read_waves_pdf, pdf, engine))
+
+def bench_get_values_pdf(directory):
+    pdf = os.path.join(directory, 'values.pdf')
+    _, expected = synthetic_pdf(pdf)
+    assert get_values_pdf(pdf) == (expected, False)
+    report_current('get_values_pdf', best_time(get_values_pdf, pdf), peak_memory(get_values_pdf, pdf))
+
+def bench_extract_pdf(directory):
+    '''
+        extract_pdf of every layout with mode 'auto', with and without the label of the rhythm strip
+        (only the layouts with a rhythm strip require it, see pdf_module.read_pdf)
+    '''
+    for profile in ('S_3x4+1_500', 'S_3x4+1_1000', 'S_6x2_500', 'S_12x1_500'):
+        pdf = os.path.join(directory, f'{profile}.pdf')
+        synthetic_pdf(pdf, profile)
+        engine = 'svg' if svg_engine_supported(pdf) else 'drawings'
+        tolerance = DRAWINGS_TOLERANCE if engine == 'drawings' else 0
+        for lead2 in (True, False):
+            expected, features = synthetic_pdf(pdf, profile, lead2=lead2)
+            result = extract_pdf(pdf, engine, 'auto')
+            if expected is None:
+                assert result is None and not lead2 and has_rhythm_strip(profile)
+                continue
+            freq = LAYOUT_PROFILES[profile]['freq']
+            assert same_waves(result[0], resample(expected, freq, TARGET_FREQ), tolerance) and result[1] == features
+        report_current(f'extract_pdf ({profile}, {engine})', best_time(extract_pdf, pdf, engine, 'auto', number=3))
+
+def bench_drivers(directory, n_files=16, workers=None):
+    '''
+        throughput of the pdf and xml batch drivers, serial and on a process pool
+        (and of the page-level pdf driver on a single pdf of n_files ECG pages)
+    '''
+    pdf_dir, xml_dir = os.path.join(directory, 'pdf'), os.path.join(directory, 'xml')
+    expected_pdf = write_fixtures(pdf_dir, n_pdf=n_files)
+    expected_xml = write_fixtures(xml_dir, n_xml=n_files)
+    pages_dir = os.path.join(directory, 'pages')
+    os.makedirs(pages_dir, exist_ok=True)
+    multipage = os.path.join(pages_dir, 'multipage.pdf')
+    expected_pages = synthetic_multipage_pdf(multipage, n_ecgs=n_files)
+    engine = 'svg' if svg_engine_supported(next(iter(expected_pdf))) else 'drawings'
+    tolerance = DRAWINGS_TOLERANCE if engine == 'drawings' else 0
+
+    for n_workers in sorted({1, workers or os.cpu_count()}):
+        start = time.perf_counter()
+        waves, features = waves_and_features(pdf_dir, workers=n_workers, engine=engine)
+        elapsed = time.perf_counter() - start
+        assert len(waves) == n_files
+        for wave, feature_dct, (expected_wave, expected_features) in zip(waves, features, expected_pdf.values()):
+            assert same_waves(wave, expected_wave, tolerance) and feature_dct == expected_features
+        print(f'{f"waves_and_features ({engine}, {n_workers} workers)":<40} {n_files / elapsed:9.1f} files/s')
+
+        start = time.perf_counter()
+        pages = page_waves_and_features(pages_dir, workers=n_workers, engine=engine)
+        elapsed = time.perf_counter() - start
+        assert sorted(pages) == [(multipage, page) for page in expected_pages]
+        for page, (expected_wave, expected_features) in expected_pages.items():
+            wave, feature_dct = pages[multipage, page]
+            assert same_waves(wave, expected_wave, tolerance) and feature_dct == dict(expected_features, page=page)
+        print(f'{f"page_waves_and_features ({n_workers} workers)":<40} {n_files / elapsed:9.1f} pages/s')
+
+        waves, headers, files_per_second = waves_and_headers_xml(xml_dir, workers=n_workers, on_error='raise')
+        assert len(waves) == n_files
+        for wave, header, (expected_wave, expected_header) in zip(waves, headers, expected_xml.values()):
+            assert np.array_equal(wave, expected_wave) and header == expected_header
+        print(f'{f"waves_and_headers_xml ({n_workers} workers)":<40} {files_per_second:9.1f} files/s')
+
+BENCHMARKS = ['parse_path', 'bytes_to_codes', 'LZW_decode', 'delta_decode', 'XLI_decode', 'resample',
+              'get_svg_data', 'read_waves_pdf', 'get_values_pdf', 'extract_pdf', 'drivers']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks of the extraction pipeline on synthetic inputs')
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run among {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--files', type=int, default=16, help='number of files of each type for the batch drivers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes for the batch drivers')
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.benchmarks or BENCHMARKS:
+            if name in ('read_waves_pdf', 'get_values_pdf', 'extract_pdf'):
+                globals()['bench_' + name](directory)
+            elif name == 'drivers':
+                bench_drivers(directory, args.files, args.workers)
+            else:
+                globals()['bench_' + name]()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''
+On-disk cache of per-file extraction results
+- an entry is keyed by the sha256 of the file content, the extractor version and the extraction options
+- the extractor version is a hash of the source of the extraction modules, so changing the code invalidates every entry
+- entries are .npz files (waves as arrays, features as json); reading an entry refreshes its modification time,
+  which 'cache_evict' uses to remove the least recently used entries first
+'''
+import os
+import json
+import zipfile
+import hashlib
+import functools
+import numpy as np
+
+EXTRACTOR_MODULES = ('parsing.py', 'pdf_module.py', 'resample_module.py', 'xml_module.py', 'svg_module.py')
+
+@functools.lru_cache()
+def extractor_version(modules=EXTRACTOR_MODULES):
+    '''
+        hash of the source files of the extraction modules
+    '''
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        with open(os.path.join(directory, module), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(path, *options, version=None):
+    '''
+        key of the cache entry of a file, e.g. cache_key(pdf, engine, mode)
+    '''
+    version = version or extractor_version()
+    options = '-'.join(str(option) for option in options)
+    return hashlib.sha256(f'{file_hash(path)}-{version}-{options}'.encode()).hexdigest()
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.npz')
+
+def cache_get(cache_dir, key):
+    '''
+        returns (hit, result) where result is (waves, features) or None (cached 'nothing to extract')
+    '''
+    path = cache_path(cache_dir, key)
+    try:
+        with np.load(path) as entry:
+            features = json.loads(str(entry['features']))
+            if features is None:
+                result = None
+            else:
+                waves = [entry[f'wave_{i}'] for i in range(int(entry['n_waves']))]
+                result = (waves, features)
+        os.utime(path)
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile): # missing, unreadable or corrupt entry, overwritten
+        return False, None
+    return True, result
+
+def cache_put(cache_dir, key, result):
+    '''
+        stores result ((waves, features) or None); the entry is written to a temporary file and renamed,
+        so concurrent readers and writers never see a partial entry
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    if result is None:
+        arrays = {'features': json.dumps(None), 'n_waves': 0}
+    else:
+        waves, features = result
+        arrays = {f'wave_{i}': wave for i, wave in enumerate(waves)}
+        arrays.update({'features': json.dumps(features), 'n_waves': len(waves)})
+
+    tmp_path = os.path.join(cache_dir, f'{key}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(tmp_path, cache_path(cache_dir, key))
+    finally:
+        # only left when writing failed (e.g. disk full), not counted by 'cache_evict'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def cache_evict(cache_dir, max_bytes):
+    '''
+        removes the least recently used entries until the cache holds at most max_bytes
+    '''
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.npz') and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def cached(func, path, cache_dir, *options):
+    '''
+        returns func(path, *options), reading it from / storing it in the cache when cache_dir is given
+        entries are keyed by the content of the file, not its path: a hit may come from a copy of the file under another
+        name, so the fields derived from the path (e.g. the file name of the features) are set again by the caller
+    '''
+    if cache_dir is None:
+        return func(path, *options)
+
+    key = cache_key(path, func.__name__, *options)
+    hit, result = cache_get(cache_dir, key)
+    if not hit:
+        result = func(path, *options)
+        cache_put(cache_dir, key, result)
+    return result
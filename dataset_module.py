@@ -0,0 +1,189 @@
+'''
+Streaming writer of extraction results to an on-disk dataset
+- waves.npy: (n, n_leads, length) memory-mapped array, each lead padded at the end (NaN for floats, 0 for ints)
+- lengths.npy: (n, n_leads) number of valid samples of each lead
+- features.parquet (if pyarrow is installed) or features.jsonl: one row per record, written in batches
+- meta.json: number of records written (the first rows of the arrays, the others are unused), dtype and shape
+records are written as they arrive, so memory use does not depend on the number of files,
+and the waves can be opened zero-copy with np.load(path, mmap_mode='r')
+the arrays, features and meta.json are saved after every batch, after which on_flush is called
+(e.g. to write the manifest records of the batch, see batch_module.commit_manifest)
+'''
+import os
+import csv
+import json
+import numpy as np
+
+def feature_row(feature_dct):
+    '''
+        flattens a feature dictionary to a row of strings (the interpretation is stored as json)
+    '''
+    return {
+        key: json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+        for key, value in feature_dct.items()
+    }
+
+def write_features(path, rows, writer=None):
+    '''
+        appends rows to a parquet file (returns the open writer), a csv file (columns of the first row)
+        or a jsonl file (used when pyarrow is not installed)
+    '''
+    if path.endswith('.parquet'):
+        import pyarrow
+        import pyarrow.parquet
+        table = pyarrow.Table.from_pylist(rows)
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+        return writer
+
+    if path.endswith('.csv'):
+        with open(path, 'a', newline='') as file:
+            csv_writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            if file.tell() == 0:
+                csv_writer.writeheader()
+            csv_writer.writerows(rows)
+        return writer
+
+    with open(path, 'a') as file:
+        for row in rows:
+            file.write(json.dumps(row) + '\n')
+    return writer
+
+def write_table(rows, path, batch_size=1024, append=False, on_flush=None):
+    '''
+        writes an iterable of rows (None items are skipped) to a .parquet, .csv or .jsonl file in batches
+        append: add the rows to the existing .csv or .jsonl file (e.g. of a resumed run) instead of replacing it
+        on_flush: called once the rows so far are saved (after every batch, only at the end for parquet files)
+        output : number of rows written
+    '''
+    if append and path.endswith('.parquet'):
+        raise ValueError(f'can not append to the parquet file {path}, use a .csv or .jsonl file')
+    if not append and os.path.exists(path):
+        os.remove(path)
+    writer = None
+    batch = []
+    count = 0
+    for row in rows:
+        if row is None:
+            continue
+        batch.append(row)
+        count += 1
+        if len(batch) == batch_size:
+            writer = write_features(path, batch, writer)
+            batch = []
+            if writer is None and on_flush is not None:
+                on_flush()
+    if batch:
+        writer = write_features(path, batch, writer)
+    if writer is not None:
+        writer.close()
+    if on_flush is not None:
+        on_flush()
+    return count
+
+DATASET_FILES = ('meta.json', 'waves.npy', 'lengths.npy', 'features.parquet', 'features.jsonl')
+
+def part_dir(out_dir, outputs=DATASET_FILES):
+    '''
+        out_dir if it holds none of the output files yet, otherwise the first out_dir/part-N (N = 1, 2, ...) without any:
+        resumed runs write their records there, so the output of the previous runs (finished or not) is kept
+    '''
+    directory, n = out_dir, 0
+    while any(os.path.exists(os.path.join(directory, name)) for name in outputs):
+        n += 1
+        directory = os.path.join(out_dir, f'part-{n}')
+    return directory
+
+def features_path(out_dir):
+    try:
+        import pyarrow.parquet
+        return os.path.join(out_dir, 'features.parquet')
+    except ImportError:
+        return os.path.join(out_dir, 'features.jsonl')
+
+def open_arrays(out_dir, n_records, n_leads, length, dtype, suffix=''):
+    waves = np.lib.format.open_memmap(os.path.join(out_dir, 'waves.npy' + suffix), mode='w+', dtype=dtype,
+                                      shape=(n_records, n_leads, length))
+    lengths = np.lib.format.open_memmap(os.path.join(out_dir, 'lengths.npy' + suffix), mode='w+', dtype=np.int32,
+                                        shape=(n_records, n_leads))
+    return waves, lengths
+
+def grow_arrays(out_dir, waves, lengths, n_records):
+    '''
+        copies the arrays to new files of n_records records, replacing the old ones
+    '''
+    grown_waves, grown_lengths = open_arrays(out_dir, n_records, *waves.shape[1:], waves.dtype, suffix='.tmp')
+    grown_waves[:len(waves)] = waves
+    grown_lengths[:len(lengths)] = lengths
+    for name in ('waves.npy', 'lengths.npy'):
+        os.replace(os.path.join(out_dir, name + '.tmp'), os.path.join(out_dir, name))
+    return grown_waves, grown_lengths
+
+def write_dataset(results, out_dir, n_records, n_leads=13, length=5000, dtype='float32', batch_size=1024, on_flush=None):
+    '''
+    input : iterable of (wave, feature_dct) (None items are skipped)
+    - n_records: expected number of records, the arrays are doubled when more arrive (see module docstring for the layout)
+    - on_flush: called once the records so far are saved (after every batch, only at the end with parquet features)
+    output : number of records written to out_dir
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    dtype = np.dtype(dtype)
+    fill = np.nan if dtype.kind == 'f' else 0
+    bounds = np.iinfo(dtype) if dtype.kind in 'iu' else None
+
+    waves, lengths = open_arrays(out_dir, max(n_records, 1), n_leads, length, dtype)
+    feature_file = features_path(out_dir)
+    if os.path.exists(feature_file):
+        os.remove(feature_file)
+
+    writer = None
+    rows = []
+    count = 0
+
+    def flush(final=False):
+        nonlocal writer
+        if rows:
+            writer = write_features(feature_file, rows, writer)
+            rows.clear()
+        if final and writer is not None:
+            writer.close()
+        waves.flush()
+        lengths.flush()
+        with open(os.path.join(out_dir, 'meta.json'), 'w') as file:
+            json.dump({'n_records': count, 'dtype': dtype.name, 'shape': list(waves.shape)}, file)
+        # rows of parquet files are only readable once the writer is closed
+        if on_flush is not None and (final or writer is None):
+            on_flush()
+
+    for result in results:
+        if result is None:
+            continue
+        wave, feature_dct = result
+        assert len(wave) == n_leads
+        if count == len(waves):
+            waves, lengths = grow_arrays(out_dir, waves, lengths, 2 * len(waves))
+
+        record = waves[count]
+        record[:] = fill
+        for i, lead in enumerate(wave):
+            assert len(lead) <= length
+            if bounds is not None:
+                lead = np.round(lead)
+                # integer dtypes would silently wrap out of range samples around
+                if len(lead) and (lead.min() < bounds.min or lead.max() > bounds.max):
+                    raise ValueError(f'lead {i} of {feature_dct.get("file_name")} has samples out of the range of {dtype.name} '
+                                     f'[{bounds.min}, {bounds.max}], use a wider or a float dtype')
+            record[i, :len(lead)] = lead
+            lengths[count, i] = len(lead)
+        rows.append(feature_row(feature_dct))
+        count += 1
+
+        if len(rows) == batch_size:
+            flush()
+
+    # rows after 'count' are left unused
+    waves[count:] = fill
+    flush(final=True)
+
+    return count
@@ -0,0 +1,184 @@
+'''
+Command-line batch extractor
+    usage: python extract.py {pdf,svg,xml} directory --out OUT [--workers N] [--shard i/n] [--cache-dir DIR] [--resume]
+- pdf, xml: waves and features are written to a dataset in OUT (see dataset_module)
+- svg: features are written to OUT/features.jsonl
+- pdf --metadata-only: the header text of page 0 is written to the index table OUT/index.csv, without extracting the waves
+- pdf --all-pages: every ECG page of multi-page pdfs is extracted (one record per page, with its 'page' feature)
+- every file is recorded in a manifest (OUT/manifest.jsonl by default), failures included with their stage and reason
+- --resume skips the files done by the previous runs and writes the output of this run to OUT/part-N (N = 1, 2, ...)
+  when OUT already holds one, so the output of the previous runs is kept
+- progress (files/s, MB/s, failures) is printed to stderr every --interval seconds,
+  followed by a summary with the failures and the mean latency of each stage and timer (see profile_module)
+- --stats writes the statistics of the batch as json, --trace-memory adds allocations, --profile runs the batch under cProfile
+    e.g. one slurm array task per node: python extract.py pdf /data/ecg --out out/$SLURM_ARRAY_TASK_ID --shard $SLURM_ARRAY_TASK_ID/$SLURM_ARRAY_TASK_COUNT
+'''
+import os
+import sys
+import time
+import argparse
+import functools
+from batch_module import iter_records, new_stats, commit_manifest, count_pending
+from cache_module import cache_evict, extractor_version
+from dataset_module import write_dataset, write_table, part_dir, DATASET_FILES
+from file_module import iter_files, count_files, parse_shard
+from pdf_module import extract_pdf_cached, extract_pdf_page, scan_pdf, iter_pdf_pages
+from profile_module import start_tracing, profiled, write_stats
+from svg_module import extract_svg_record
+from xml_module import extract_xml
+
+EXTENSIONS = {'pdf': ('.pdf',), 'svg': ('.svg',), 'xml': ('.xml',)}
+NONE_STATUS = {'pdf': 'missing_lead2', 'svg': 'skipped', 'xml': 'skipped'}
+WAVE_SHAPES = {'pdf': (13, 5000), 'xml': (12, 5500)}   # (n_leads, length) of the dataset
+
+def progress_line(stats, total, elapsed):
+    # total is None when the items aren't counted in advance (the pages of --all-pages)
+    done = f'{stats["files"]}/{total} files' if total is not None else f'{stats["files"]} pages'
+    failures = sum(stats['failures'].values())
+    return (f'{done}   {stats["files"] / max(elapsed, 1e-9):.1f} files/s   '
+            f'{stats["bytes"] / 1e6 / max(elapsed, 1e-9):.2f} MB/s   {failures} failures')
+
+def with_progress(records, stats, total, interval):
+    '''
+        passes records through, printing the progress to stderr every interval seconds
+    '''
+    start = last = time.perf_counter()
+    for record in records:
+        yield record
+        now = time.perf_counter()
+        if now - last >= interval:
+            print(progress_line(stats, total, now - start), file=sys.stderr, flush=True)
+            last = now
+
+def print_summary(stats, total, elapsed):
+    print(progress_line(stats, total, elapsed) + f'   ({elapsed:.1f} s)', file=sys.stderr)
+    for status, count in sorted(stats['status'].items()):
+        print(f'  {status:<16} {count}', file=sys.stderr)
+    for name, count in sorted(stats['failures'].items()):
+        print(f'  failed at {name:<16} {count}', file=sys.stderr)
+    for name, stage_stats in stats['stages'].items():
+        line = f'  {name:<16} {stage_stats["seconds"] / stage_stats["files"] * 1e3:9.2f} ms/file'
+        if stage_stats['bytes']:
+            line += f'   {stage_stats["bytes"] / 1e6 / max(stage_stats["seconds"], 1e-9):8.2f} MB/s'
+        if 'peak' in stage_stats:
+            line += f'   {stage_stats["allocated"] / stage_stats["files"] / 1e6:8.2f} MB allocated/file   peak {stage_stats["peak"] / 1e6:.2f} MB'
+        print(line, file=sys.stderr)
+
+def extractor(args):
+    if args.kind == 'pdf' and args.metadata_only:
+        return functools.partial(scan_pdf, clip=args.header_region)
+    if args.kind == 'pdf' and args.all_pages:
+        return functools.partial(extract_pdf_page, engine=args.engine, mode=args.mode, cache_dir=args.cache_dir)
+    if args.kind == 'pdf':
+        return functools.partial(extract_pdf_cached, engine=args.engine, mode=args.mode, cache_dir=args.cache_dir)
+    if args.kind == 'svg':
+        return functools.partial(extract_svg_record, sidecar=args.sidecar)
+    return extract_xml
+
+def parse_region(string):
+    region = tuple(float(value) for value in string.split(','))
+    assert len(region) == 4
+    return region
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='extract ECG waves and features from a directory of pdf, svg or xml files')
+    parser.add_argument('kind', choices=sorted(EXTENSIONS), help='type of the input files')
+    parser.add_argument('directory', help='input directory')
+    parser.add_argument('--out', required=True, help='output directory')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=1, help='files sent to a worker per task')
+    parser.add_argument('--shard', type=parse_shard, default=None, help="'i/n': only process the i-th of n disjoint parts of the input")
+    parser.add_argument('--pattern', default=None, help="glob pattern of the file names, e.g. 'ECG_2014*'")
+    parser.add_argument('--no-recursive', dest='recursive', action='store_false', help='do not walk sub-directories')
+    parser.add_argument('--manifest', default=None, help='jsonl record of every processed file (default: OUT/manifest.jsonl)')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the files recorded as done in the manifest; the output of this run is written to '
+                             'a new OUT/part-N if OUT already holds one, the output of the previous runs is kept')
+    parser.add_argument('--on-error', choices=('record', 'raise'), default='record', help='record failures and go on, or stop')
+    parser.add_argument('--cache-dir', default=None, help='extraction cache (pdf only, see cache_module)')
+    parser.add_argument('--cache-max-bytes', type=int, default=None, help='size of the cache kept after the run')
+    parser.add_argument('--engine', choices=('svg', 'drawings'), default='svg', help='pdf waveform engine')
+    parser.add_argument('--mode', default='S', help="pdf vendor, layout profile or 'auto'")
+    parser.add_argument('--metadata-only', action='store_true',
+                        help='pdf: only read the header text of page 0 and write the index table OUT/index.csv')
+    parser.add_argument('--header-region', type=parse_region, default=None,
+                        help="'x0,y0,x1,y1': fractions of the page to read with --metadata-only (default: the whole page)")
+    parser.add_argument('--all-pages', action='store_true',
+                        help='pdf: extract every ECG page of each pdf instead of page 0, the pages are processed in parallel')
+    parser.add_argument('--sidecar', action='store_true', help='svg: also save a json file next to each svg file')
+    parser.add_argument('--dtype', default='float32', help='dtype of the waves in the dataset')
+    parser.add_argument('--interval', type=float, default=10, help='seconds between progress lines')
+    parser.add_argument('--stats', default=None, help='json file to write the statistics of the batch to')
+    parser.add_argument('--trace-memory', action='store_true', help='record the allocations of each stage (slower)')
+    parser.add_argument('--profile', default=None,
+                        help='save a cProfile profile of the batch to this file (only the main process, use --workers 1)')
+    args = parser.parse_args(argv)
+    if args.all_pages and args.metadata_only:
+        parser.error('--all-pages and --metadata-only are exclusive')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace_memory:
+        start_tracing()
+    if args.profile is not None:
+        with profiled(args.profile):
+            run(args)
+    else:
+        run(args)
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    manifest = args.manifest or os.path.join(args.out, 'manifest.jsonl')
+    extensions = EXTENSIONS[args.kind]
+
+    total = count_files(args.directory, extensions, args.pattern, args.recursive, args.shard)
+    paths = iter_files(args.directory, extensions, args.pattern, args.recursive, args.shard)
+    all_pages = args.kind == 'pdf' and args.all_pages
+    if all_pages:
+        # the pages are listed lazily and told apart from the text-only pages by the workers (see pdf_module.extract_pdf_page)
+        paths = iter_pdf_pages(paths)
+    stats = new_stats()
+    start = time.perf_counter()
+
+    # the manifest records of the files done are only written once their output is saved, see batch_module.iter_records
+    pending = []
+    records = iter_records(extractor(args), paths, args.workers, args.chunksize, on_error=args.on_error,
+                           none_status=NONE_STATUS[args.kind], manifest=manifest, resume=args.resume, stats=stats,
+                           pending=pending)
+    records = with_progress(records, stats, None if all_pages else total, args.interval)
+    results = (result if status == 'ok' else None for _, status, result in records)
+
+    on_flush = functools.partial(commit_manifest, manifest, pending)
+
+    if args.kind == 'svg':
+        outputs = ('features.jsonl',)
+    elif args.metadata_only:
+        outputs = ('index.csv',)
+    else:
+        outputs = DATASET_FILES
+    out_dir = part_dir(args.out, outputs) if args.resume else args.out
+    if outputs == DATASET_FILES:
+        n_leads, length = WAVE_SHAPES[args.kind]
+        # a resumed run is sized for the files left to do, and --all-pages for one page per pdf,
+        # the dataset grows if more records arrive (see dataset_module.grow_arrays)
+        n_records = total
+        if args.resume and not all_pages:
+            n_records = count_pending(iter_files(args.directory, extensions, args.pattern, args.recursive, args.shard),
+                                      manifest)
+        count = write_dataset(results, out_dir, n_records, n_leads=n_leads, length=length, dtype=args.dtype,
+                              on_flush=on_flush)
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+        count = write_table(results, os.path.join(out_dir, outputs[0]), on_flush=on_flush)
+
+    if args.cache_dir is not None and args.cache_max_bytes is not None:
+        cache_evict(args.cache_dir, args.cache_max_bytes)
+
+    print_summary(stats, None if all_pages else total, time.perf_counter() - start)
+    print(f'{count} records written to {out_dir}', file=sys.stderr)
+    if args.stats is not None:
+        write_stats(args.stats, stats, args=vars(args), version=extractor_version())
+
+if __name__ == '__main__':
+    main()
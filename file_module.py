@@ -0,0 +1,60 @@
+'''
+Lazy discovery of input files for the batch drivers
+'''
+import os
+import zlib
+import fnmatch
+
+def parse_shard(string):
+    '''
+        'i/n' -> (i, n), e.g. '0/4' for the first of four shards
+    '''
+    index, count = (int(part) for part in string.split('/'))
+    assert 0 <= index < count
+    return index, count
+
+def in_shard(relative_path, shard):
+    '''
+        whether a file belongs to shard (i, n); the assignment only depends on the path relative to the input directory,
+        so nodes mounting the archive at different places split it the same way without coordination
+    '''
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(relative_path.replace(os.sep, '/').encode()) % count == index
+
+def iter_files(directory, extensions=('.pdf',), pattern=None, recursive=True, shard=None):
+    '''
+        lazily yields the paths of the files under directory (sorted within each directory)
+        - extensions: kept file extensions (case insensitive), None keeps every file
+        - pattern: optional glob pattern the file name must match, e.g. 'ECG_2014*'
+        - recursive: also walk sub-directories
+        - shard: (i, n) to only yield the i-th of n disjoint parts of the files
+    '''
+    if extensions is not None:
+        extensions = tuple(extension.lower() for extension in extensions)
+
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir():
+                if recursive:
+                    subdirectories.append(entry.path)
+                continue
+            if extensions is not None and not entry.name.lower().endswith(extensions):
+                continue
+            if pattern is not None and not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            if in_shard(os.path.relpath(entry.path, directory), shard):
+                yield entry.path
+
+        # visit sub-directories in name order
+        stack.extend(reversed(subdirectories))
+
+def count_files(directory, extensions=('.pdf',), pattern=None, recursive=True, shard=None):
+    return sum(1 for _ in iter_files(directory, extensions, pattern, recursive, shard))
@@ -4,11 +4,197 @@ Wave extraction script from .svg files
 - since older ecg files (like ones before 2007) had 250Hz frequencies, I have made manual changes to the script
     - each change can be searched with "# CORRECTION"
     - the corrections are made only to work with mode = 'S' (Severance), so using this script for extracting HY type ecg files will not work
+- page layouts (vendor, lead arrangement, frequency) are described by layout profiles, see 'register_profile'
 '''
+import io
+import os
+import re
 import numpy as np
+from collections import Counter
 import xml.etree.ElementTree as ET
+from profile_module import timer
+
+# (number of vertices, height in svg user units) of the calibration markers drawn at the baseline of each row
+BASE_MARKERS = {
+    'H': (8, 82),
+    'S': (60, 1000),
+}
+
+# leads returned by 'get_path_data', in this order for every layout (the order of the 3x4+1 layout):
+# the 10s rhythm strip of lead II, then the 12 leads; the leads a layout does not have are returned empty
+LEADS = ['II rhythm', 'I', 'II', 'III', 'aVR', 'aVL', 'aVF', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6']
+
+# leads of each layout as (lead, row, column), in the order of the lengths of its profiles
+# rows are counted from the top of the page and columns from the left, each row has its own base marker
+LAYOUTS = {
+    '3x4+1': [
+        ('II rhythm', 3, 0), # 10s rhythm strip
+        ('I', 0, 0), ('II', 1, 0), ('III', 2, 0),
+        ('aVR', 0, 1), ('aVL', 1, 1), ('aVF', 2, 1),
+        ('V1', 0, 2), ('V2', 1, 2), ('V3', 2, 2),
+        ('V4', 0, 3), ('V5', 1, 3), ('V6', 2, 3),
+    ],
+    '6x2': [
+        ('I', 0, 0), ('II', 1, 0), ('III', 2, 0), ('aVR', 3, 0), ('aVL', 4, 0), ('aVF', 5, 0),
+        ('V1', 0, 1), ('V2', 1, 1), ('V3', 2, 1), ('V4', 3, 1), ('V5', 4, 1), ('V6', 5, 1),
+    ],
+    '12x1': [
+        ('I', 0, 0), ('II', 1, 0), ('III', 2, 0), ('aVR', 3, 0), ('aVL', 4, 0), ('aVF', 5, 0),
+        ('V1', 6, 0), ('V2', 7, 0), ('V3', 8, 0), ('V4', 9, 0), ('V5', 10, 0), ('V6', 11, 0),
+    ],
+}
+
+# layout profiles: vendor (base marker), layout, frequency and number of vertices of each lead (in layout order)
+LAYOUT_PROFILES = {}
+# fingerprint (histogram of the numbers of vertices of markers and leads) -> profile name
+FINGERPRINTS = {}
+
+def profile_fingerprint(profile):
+    num_base = BASE_MARKERS[profile['vendor']][0]
+    n_rows = len({row for _, row, _ in LAYOUTS[profile['layout']]})
+    return frozenset(Counter(profile['lengths'] + [num_base] * n_rows).items())
+
+def register_profile(name, vendor, layout, freq, lengths):
+    '''
+    adds a layout profile, e.g. for a new vendor or sampling rate
+    - lengths: number of vertices of each lead of the layout, in the order of LAYOUTS[layout]
+    '''
+    assert vendor in BASE_MARKERS and layout in LAYOUTS
+    assert all(lead in LEADS for lead, _, _ in LAYOUTS[layout])
+    assert len(lengths) == len(LAYOUTS[layout])
+    profile = {'vendor': vendor, 'layout': layout, 'freq': freq, 'lengths': list(lengths)}
+    fingerprint = profile_fingerprint(profile)
+    assert FINGERPRINTS.get(fingerprint, name) == name, f'{name} is indistinguishable from {FINGERPRINTS.get(fingerprint)}'
+    LAYOUT_PROFILES[name] = profile
+    FINGERPRINTS[fingerprint] = name
+
+def grid_lengths(layout, first_num, remained_num, last_num=None):
+    '''
+    lead lengths of a layout whose first column (and rhythm strip in the last row) differ from the other columns
+    '''
+    last_row = max(row for _, row, _ in LAYOUTS[layout])
+    return [
+        last_num if last_num is not None and row == last_row else first_num if col == 0 else remained_num
+        for _, row, col in LAYOUTS[layout]
+    ]
+
+register_profile('H_3x4+1_500', 'H', '3x4+1', 500, grid_lengths('3x4+1', 1247, 1250, 4997))
+register_profile('S_3x4+1_500', 'S', '3x4+1', 500, grid_lengths('3x4+1', 1238, 1238, 5000))
+register_profile('S_3x4+1_250', 'S', '3x4+1', 250, grid_lengths('3x4+1', 619, 619, 2500)) # CORRECTION: ADDED 250Hz profile
+# the vertex counts below are derived from S_3x4+1_500, not measured on vendor pdfs (check them on a real file first):
+# - 1000 Hz: twice the 500 Hz counts
+# - 6x2, 12x1: 500 Hz leads of 5 s and 10 s (one column of 6x2 spans half the 10 s width of the page)
+register_profile('S_3x4+1_1000', 'S', '3x4+1', 1000, grid_lengths('3x4+1', 2476, 2476, 10000))
+register_profile('S_6x2_500', 'S', '6x2', 500, grid_lengths('6x2', 2500, 2500))
+register_profile('S_12x1_500', 'S', '12x1', 500, grid_lengths('12x1', 5000, 5000))
+
+def has_rhythm_strip(name):
+    '''
+    whether the layout of the profile has the 10s rhythm strip of lead II ('II rhythm' of LEADS)
+    '''
+    return any(lead == 'II rhythm' for lead, _, _ in LAYOUTS[LAYOUT_PROFILES[name]['layout']])
+
+class NoProfileError(AssertionError):
+    '''
+    no layout profile matches the paths of the page (see 'detect_profile')
+    '''
+
+def candidate_profiles(mode):
+    '''
+    mode: a vendor ('H', 'S'), a profile name, or 'auto' for every registered profile
+    '''
+    if mode in LAYOUT_PROFILES:
+        return [mode]
+    return [name for name, profile in LAYOUT_PROFILES.items() if mode in ('auto', profile['vendor'])]
+
+def profile_lengths(names):
+    '''
+    numbers of vertices of the markers and leads of the given profiles
+    '''
+    return sorted({n for name in names for n, _ in profile_fingerprint(LAYOUT_PROFILES[name])})
+
+def detect_profile(lengths, mode='auto'):
+    '''
+    returns the name of the profile matching the numbers of vertices of the paths of a page, or None
+    - the histogram restricted to the marker and lead lengths is looked up in FINGERPRINTS,
+      then profiles whose markers and leads are all present (with extra paths) are considered
+    '''
+    names = candidate_profiles(mode)
+    interesting = set(profile_lengths(names))
+    histogram = Counter(n for n in lengths if n in interesting)
+
+    name = FINGERPRINTS.get(frozenset(histogram.items()))
+    if name in names:
+        return name
+
+    matches = [name for name in names if all(histogram[n] >= count for n, count in profile_fingerprint(LAYOUT_PROFILES[name]))]
+    if not matches:
+        return None
+    return max(matches, key=lambda name: len(LAYOUT_PROFILES[name]['lengths']))
+
+POLYLINE_COMMANDS = re.compile('[MmLl]')
+ABSOLUTE_COMMANDS = re.compile('[ML]')
+RELATIVE_COMMANDS = re.compile('[ml]')
+NOT_POLYLINE_COMMANDS = re.compile('[ZzHhVvCcSsQqTtAa]')
+SEPARATORS = str.maketrans('MmLl,', '     ')
+ALL_SEPARATORS = str.maketrans('MmZzLlHhVvCcSsQqTtAa,', ' ' * 21)
+
+def parse_polyline(pathdef):
+    '''
+    fast path of 'parse_path' for paths made only of M/L (or relative m/l) commands, such as the leads
+    returns the (n, 2) array of vertices, or None if the path contains any other command
+    '''
+    if NOT_POLYLINE_COMMANDS.search(pathdef):
+        return None
+
+    if pathdef.lstrip()[:1] not in ('M', 'm'):
+        return None
+    try:
+        values = np.array(pathdef.translate(SEPARATORS).split(), dtype=float)
+    except ValueError: # e.g. numbers that are not separated by ' ' or ','
+        return None
+    if len(values) % 2:
+        return None
+    verts = values.reshape(-1, 2)
+
+    if not RELATIVE_COMMANDS.search(pathdef):
+        return verts
+    if not ABSOLUTE_COMMANDS.search(pathdef):
+        return np.cumsum(verts, axis=0)
+
+    # mixed absolute and relative commands: accumulate relative coordinates from the last absolute vertex
+    commands = POLYLINE_COMMANDS.findall(pathdef)
+    segments = POLYLINE_COMMANDS.split(pathdef)[1:]
+    counts = [len(segment.translate(SEPARATORS).split()) // 2 for segment in segments]
+    if sum(counts) != len(verts):
+        return None
+    absolute = np.repeat([command.isupper() for command in commands], counts)
+    starts = np.flatnonzero(absolute)
+    if len(starts) == 0 or starts[0] != 0:
+        starts = np.concatenate([[0], starts])
+    for begin, end in zip(starts, list(starts[1:]) + [len(verts)]):
+        verts[begin:end] = np.cumsum(verts[begin:end], axis=0)
+    return verts
+
+def vertex_bounds(pathdef):
+    '''
+    lower and upper bounds of the number of vertices 'parse_path' returns for pathdef, without parsing it
+    (both bounds are exact for M/L polylines)
+    '''
+    n_numbers = len(pathdef.translate(ALL_SEPARATORS).split())
+    if not NOT_POLYLINE_COMMANDS.search(pathdef):
+        return n_numbers // 2, n_numbers // 2
+
+    # every command gives one vertex out of one (H, V) to six (C) numbers, and every Z adds one or two vertices
+    n_close = pathdef.count('Z') + pathdef.count('z')
+    return (n_numbers + 5) // 6 + n_close, n_numbers + 2 * n_close
 
 def parse_path(pathdef, current_pos=0 + 0j):
+    if current_pos == 0:
+        verts = parse_polyline(pathdef)
+        if verts is not None:
+            return verts
+
     verts = []
     for c, v in _parse_path(pathdef, current_pos):
         verts.append(list(v[0]))
@@ -168,174 +354,131 @@ def _parse_path(pathdef, current_pos):
             yield COMMAND_CODES['T'], verts
             current_pos = end
             
+def iter_attrib(source):
+    '''
+    yields the 'd' attribute of every path element of an svg file (file name or file object) while parsing it
+    - every element is removed from its parent once it is processed, so memory does not grow with the document
+    '''
+    parents = []
+    for event, el in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if el.tag[-4:] == 'path':
+                yield el.attrib['d']
+            parents.append(el)
+        else:
+            parents.pop()
+            el.clear()
+            if parents:
+                parents[-1].remove(el)
+
+def iter_attrib_string(str):
+    return iter_attrib(io.StringIO(str))
+
 def get_attrib(file_name):
-    tree = ET.parse(file_name)
-    result = []
-    for el in tree.iter():
-        if el.tag[-4:] == 'path':
-            result.append(el)
-
-    result2 = []
-    for el in result:
-        result2.append(
-            el.attrib['d']
-        )
-    return result2
+    return list(iter_attrib(file_name))
 
 def get_attrib_string(str):
-    tree = ET.fromstring(str)
-    result = []
-    for el in tree.iter():
-        if el.tag[-4:] == 'path':
-            result.append(el)
-
-    result2 = []
-    for el in result:
-        result2.append(
-            el.attrib['d']
-        )
-    return result2
+    return list(iter_attrib_string(str))
 
 
 def get_svg_data(mode, file_name):
-    if mode != 'H' and mode != 'S':
-        print('H or S only')
+    '''
+    mode: a vendor ('H', 'S'), a layout profile name, or 'auto' (see 'candidate_profiles')
+    '''
+    if not candidate_profiles(mode):
+        print('H, S, auto or a layout profile only')
         return
 
-    if mode == 'H':
-        NUM_BASE = 8
-        VALID_LENGTHS = [1247, 1250, 4997]
-        FIRST_COLUMN_NUM = 1247
-        REMAINED_NUM = 1250
-        LAST_NUM = 4997
-        DEFAULT_GAP = 82
+    attribs = []
+    if file_name[0] == '<': # We implicity assume that svg string starts with '<'
+        attribs, nbytes = iter_attrib_string(file_name), len(file_name)
     else:
-        NUM_BASE = 60
-        VALID_LENGTHS = [619, 2500, 1238, 5000] # CORRECTION: ADDED 619, 2500 to handle waves with 250Hz frequency
-        FIRST_COLUMN_NUM = 1238
-        REMAINED_NUM = 1238
-        LAST_NUM = 5000
-        DEFAULT_GAP = 1000
-        
-        # CORRECTION: ADDED below three lines to handle waves with 250Hz frequency
-        FIRST_COLUMN_NUM_250 = 619
-        REMAINED_NUM_250 = 619
-        LAST_NUM_250 = 2500
+        attribs, nbytes = iter_attrib(file_name), os.path.getsize(file_name)
+
+    # only parse the paths which can be a base marker or a lead (grid lines, pulses etc. are skipped)
+    lengths = profile_lengths(candidate_profiles(mode))
+    with timer('get_attrib', nbytes):
+        candidates = []
+        for el in attribs:
+            lower, upper = vertex_bounds(el)
+            if any(lower <= length <= upper for length in lengths):
+                candidates.append(el)
+
+    with timer('parse_path', sum(len(el) for el in candidates)):
+        result = [parse_path(el) for el in candidates]
+
+    return get_path_data(mode, result)
+
+
+def get_path_data(mode, result):
+    '''
+    extracts the waves from the vertices of every path on the page
+    (each element of 'result' is an (n, 2) array of x, y coordinates as returned by 'parse_path')
+    - the layout profile is detected from the numbers of vertices of the paths (see 'detect_profile')
+    - returns (waves, freq), the waves of every layout in the order of LEADS (leads missing from the layout are empty)
+    '''
+    if not candidate_profiles(mode):
+        print('H, S, auto or a layout profile only')
+        return
+
+    with timer('assemble'):
+        return _get_path_data(mode, result)
+
+def _get_path_data(mode, result):
+    name = detect_profile([len(el) for el in result], mode)
+    if name is None:
+        raise NoProfileError('no layout profile matches the paths of the page')
+    profile = LAYOUT_PROFILES[name]
+    layout = LAYOUTS[profile['layout']]
+    NUM_BASE, DEFAULT_GAP = BASE_MARKERS[profile['vendor']]
+    row_sizes = np.bincount([row for _, row, _ in layout])
 
     def get_base(arrays):
         _result = []
         for _el in arrays:
             if len(_el) == NUM_BASE:
-                assert np.max(_el[:, 1]) - _el[0][1] == DEFAULT_GAP
+                assert np.isclose(np.max(_el[:, 1]) - _el[0][1], DEFAULT_GAP)
                 _result.append(_el[0][1])
         return _result
 
     def get_data(arrays):
         _result = []
         for _el in arrays:
-            if len(_el) in VALID_LENGTHS:
+            if len(_el) in profile['lengths']:
                 _result.append(_el)
                 
         return _result
 
-    attribs = []
-    if file_name[0] == '<': # We implicity assume that svg string starts with '<'
-        attribs = get_attrib_string(file_name)
-    else:
-        attribs = get_attrib(file_name)
-
-    result = []
-    for el in attribs:
-        result.append(
-            parse_path(el)
-        )
-
     base = get_base(result)
     list_of_arrays = get_data(result)
-    assert len(base) == 4
-    assert len(list_of_arrays) == 13
-
-    # CORRECTION: ADDED below assert statement
-    assert np.all([list_of_arrays[j].shape[0] == list_of_arrays[0].shape[0] for j in range(12)]) 
-
-    # CORRECTION: ADDED below if-elif-else statement to initiate FREQ variable
-    if list_of_arrays[0].shape[0] == 1238:
-        assert list_of_arrays[12].shape[0] == 5000
-        FREQ = 500
-        
-    elif list_of_arrays[0].shape[0] == 619:
-        assert list_of_arrays[12].shape[0] == 2500
-        FREQ = 250
-        
-    else:
-        assert(False)
-
-
-    base.sort(reverse=True)
-    list_of_arrays.sort(reverse=True, key=lambda x: np.median(x[:, 1]))
-
-    first_row = list_of_arrays[:4]
-    second_row = list_of_arrays[4:8]
-    third_row = list_of_arrays[8:12]
-    last_row = list_of_arrays[-1]
-    first_row.sort(key=lambda x: x[0][0])
-    second_row.sort(key=lambda x: x[0][0])
-    third_row.sort(key=lambda x: x[0][0])
-
-    # CORRECTION: ADDED if-else statement to handle waves with 250Hz frequency
-    # originally the if statement body was all that existed
-    if FREQ == 500:
-        wave_1 = first_row[0] - np.array([[0, base[0]]] * FIRST_COLUMN_NUM)
-        wave_aVR = first_row[1] - np.array([[0, base[0]]] * REMAINED_NUM)
-        wave_V1 = first_row[2] - np.array([[0, base[0]]] * REMAINED_NUM)
-        wave_V4 = first_row[3] - np.array([[0, base[0]]] * REMAINED_NUM)
-
-        wave_2 = second_row[0] - np.array([[0, base[1]]] * FIRST_COLUMN_NUM)
-        wave_aVL = second_row[1] - np.array([[0, base[1]]] * REMAINED_NUM)
-        wave_V2 = second_row[2] - np.array([[0, base[1]]] * REMAINED_NUM)
-        wave_V5 = second_row[3] - np.array([[0, base[1]]] * REMAINED_NUM)
-
-        wave_3 = third_row[0] - np.array([[0, base[2]]] * FIRST_COLUMN_NUM)
-        wave_aVF = third_row[1] - np.array([[0, base[2]]] * REMAINED_NUM)
-        wave_V3 = third_row[2] - np.array([[0, base[2]]] * REMAINED_NUM)
-        wave_V6 = third_row[3] - np.array([[0, base[2]]] * REMAINED_NUM)
-
-        wave_2_whole = last_row - np.array([[0, base[3]]] * LAST_NUM)
-        
-    else: 
-        assert(FREQ == 250)
-
-        wave_1 = first_row[0] - np.array([[0, base[0]]] * FIRST_COLUMN_NUM_250)
-        wave_aVR = first_row[1] - np.array([[0, base[0]]] * REMAINED_NUM_250)
-        wave_V1 = first_row[2] - np.array([[0, base[0]]] * REMAINED_NUM_250)
-        wave_V4 = first_row[3] - np.array([[0, base[0]]] * REMAINED_NUM_250)
-
-        wave_2 = second_row[0] - np.array([[0, base[1]]] * FIRST_COLUMN_NUM_250)
-        wave_aVL = second_row[1] - np.array([[0, base[1]]] * REMAINED_NUM_250)
-        wave_V2 = second_row[2] - np.array([[0, base[1]]] * REMAINED_NUM_250)
-        wave_V5 = second_row[3] - np.array([[0, base[1]]] * REMAINED_NUM_250)
-
-        wave_3 = third_row[0] - np.array([[0, base[2]]] * FIRST_COLUMN_NUM_250)
-        wave_aVF = third_row[1] - np.array([[0, base[2]]] * REMAINED_NUM_250)
-        wave_V3 = third_row[2] - np.array([[0, base[2]]] * REMAINED_NUM_250)
-        wave_V6 = third_row[3] - np.array([[0, base[2]]] * REMAINED_NUM_250)
-
-        wave_2_whole = last_row - np.array([[0, base[3]]] * LAST_NUM_250)
-        
+    assert len(base) == len(row_sizes)
+    assert len(list_of_arrays) == len(layout)
+
+    # split the leads into rows (higher y first) and sort each row by x, using keys computed once per lead
+    base = np.sort(base)[::-1]
+    medians = np.array([np.median(el[:, 1]) for el in list_of_arrays])
+    starts = np.array([el[0][0] for el in list_of_arrays])
+    by_row = np.argsort(-medians, kind='stable')
+    grid = {}
+    begin = 0
+    for row, size in enumerate(row_sizes):
+        members = by_row[begin:begin + size]
+        for col, idx in enumerate(members[np.argsort(starts[members], kind='stable')]):
+            grid[row, col] = idx
+        begin += size
+
+    order = [grid[row, col] for _, row, col in layout]
+    rows = np.array([row for _, row, _ in layout])
+    lengths = np.array([len(list_of_arrays[idx]) for idx in order])
+    assert np.array_equal(lengths, profile['lengths'])
+
+    # subtract the baseline of each row from the y-values of all leads at once
+    waves = np.concatenate([list_of_arrays[idx][:, 1] for idx in order])
+    waves -= np.repeat(base[rows], lengths)
+
+    # same lead order for every layout, so that the waves of pages of different layouts can be stacked
+    waves = dict(zip([lead for lead, _, _ in layout], np.split(waves, np.cumsum(lengths)[:-1])))
+
     # CORRECTION: Added FREQ to be a return variable
     # CORRECTION: changed so that only the y-values were returned
-    return [
-        wave_2_whole[:,1],
-        wave_1[:,1],
-        wave_2[:,1],
-        wave_3[:,1],
-        wave_aVR[:,1],
-        wave_aVL[:,1],
-        wave_aVF[:,1],
-        wave_V1[:,1],
-        wave_V2[:,1],
-        wave_V3[:,1],
-        wave_V4[:,1],
-        wave_V5[:,1],
-        wave_V6[:,1],
-    ], FREQ
\ No newline at end of file
+    return [waves.get(lead, np.empty(0)) for lead in LEADS], profile['freq']
@@ -1,44 +1,59 @@
 import re
 import fitz
 import os
+import functools
 import numpy as np
-from parsing import get_svg_data
+from parsing import get_svg_data, get_path_data, detect_profile, candidate_profiles, has_rhythm_strip, NoProfileError, BASE_MARKERS, LAYOUT_PROFILES
+from batch_module import StageError, stage, iter_records, Skipped, commit_manifest, count_pending
+from profile_module import timer
+from cache_module import cached, cache_evict
+from dataset_module import write_dataset, write_table, feature_row, part_dir
+from file_module import iter_files
+from resample_module import resample
 import scipy.interpolate
 
-
-def find_newline(str):
-    indices = [-1]
-    for i in range(len(str)):
-        if str[i] == '\n':
-            indices.append(i)
-    return indices
+TARGET_FREQ = 500   # sampling rate of the extracted waves (see 'extract_pdf')
 
 def split_newline(str):
-    list_of_str = []
-    indices = find_newline(str)
-    for i in range(len(indices)-1):
-        begin = indices[i] + 1
-        end = indices[i+1]
-        list_of_str.append(str[begin:end])
-
-    return list_of_str
+    # lines ending with '\n' (text after the last '\n' is dropped)
+    return str.split('\n')[:-1]
 
+# labels of the header text blocks, found in one pass over the blocks of the page (see 'header_block_indices')
+HEADER_LABELS = re.compile(
+    r'(?P<id>\nID:)|(?P<speed>mm/s)|(?P<rate>Vent\.)|(?P<PR>PR interval)|(?P<QRS>QRS duration)'
+    r'|(?P<QT>QT/QTc)|(?P<axes>P-R-T axes)|(?P<age>yr)|(?P<gender>ale)'
+)
 
-def filenames_in(directory):
+class HeaderNotFoundError(AssertionError):
     '''
-        returns filenames(without extension) in directory
+        the text of the page has no header of an ECG report (e.g. a text-only page of a combined export, see 'extract_pdf_page')
     '''
-    filelist = os.listdirectory(directory)
-    filenames = []
 
-    for file in filelist:
-        filename = directory + file.split('.')[0]
-        filenames.append(filename)
+def header_block_indices(subtext):
+    '''
+        returns {label: index of the first block containing it} for the labels of HEADER_LABELS
+        - 'id' is the block of the patient id, 'speed' the first block containing 'mm/s' after it,
+          the other labels are only searched after 'speed' (the interpretation may contain any text)
+    '''
+    indices = {}
+    for i, text in enumerate(subtext):
+        for match in HEADER_LABELS.finditer(text):
+            label = match.lastgroup
+            if label in indices:
+                continue
+            if label == 'id' or ('id' in indices and (label == 'speed' or 'speed' in indices)):
+                indices[label] = i
 
-    filenames = np.asarray(filenames)
-    filenames = np.unique(filenames)
+    missing = [label for label in HEADER_LABELS.groupindex if label not in indices]
+    if missing:
+        raise HeaderNotFoundError(f'header labels not found: {missing}')
+    return indices
 
-    return filenames
+def filenames_in(directory, recursive=False):
+    '''
+        returns paths of the pdfs in directory, without extension
+    '''
+    return [os.path.splitext(path)[0] for path in iter_files(directory, ('.pdf',), recursive=recursive)]
 
 def parse_month(month):
     return {
@@ -79,64 +94,50 @@ def parse_gender(gender):
     assert(gender.upper() in {'MALE','FEMALE'})
     return gender.upper()
 
-def get_values_pdf(path):
+def get_values_pdf(path, page_number=0):
     '''
     PDF version of function 'get_values' in 'svg_module.py'
     '''
-    assert(path.endswith('.pdf'))
-    
-    missing_lead2 = False 
-    doc = fitz.open(path)
-    page = doc.load_page(0)
+    assert(path.lower().endswith('.pdf'))
+
+    with fitz.open(path) as doc:
+        page = doc.load_page(page_number)
+        return get_values_page(page, path)
+
+def get_values_page(page, path, clip=None):
+    '''
+    extracts features from an already loaded pdf page (see 'get_values_pdf')
+    clip: only read the text inside this rectangle (e.g. the header region, see 'scan_pdf'),
+          missing_lead2 is then None as the leadnames are outside of it
+    '''
     file_name = path.split('/')[-1]
 
-    # read text
-    blocks = page.get_text_blocks()
-    subtext = []
-    for i in range(len(blocks)):
-        subtext.append(blocks[i][4])
-
-    # skip subtext which are leadnames ('I','II', etc.)
-    if not subtext[12].startswith('II'):
-        # 10s leads 2 are missing in some old pdfs
-        print(f'LEAD II MISSING FOR {path}')
-        missing_lead2 = True
-        subtext = subtext[12:]
-    else:
-        subtext = subtext[13:]
+    # read text and find the header blocks by their labels
+    subtext = [block[4] for block in page.get_text_blocks(clip=clip)]
+    indices = header_block_indices(subtext)
+
+    # the blocks before the header are leadnames ('I','II', etc.), ending with 'II' when the page has the 10s lead 2
+    # (missing in some old pdfs, and in the layouts without rhythm strip such as 6x2, see 'read_pdf')
+    missing_lead2 = None if clip is not None else not subtext[indices['id'] - 1].startswith('II')
 
     # extract patient_id, date, time
-    line = split_newline(subtext[0]) # convert a string containing '\n' to several strings
+    line = split_newline(subtext[indices['id']]) # convert a string containing '\n' to several strings
     patient_id = parse_id(line)
     date, _ ,time = line[2].split(' ')
     date = parse_date(date)
     assert(date[4] == '-') # e.g. 2014-05-29
     assert(time[2] == ':') # e.g. 08:54:41
 
-    # extract descriptions and declare rest of the subtext as 'rest'
-    for i in range(len(subtext)):
-        if 'mm/s' in subtext[i]:
-            interpretation = [{"Diagnosis": d[:-1]} for d in subtext[1:i]]
-            rest = subtext[i:]
-            break
-
-    assert('Vent.' in rest[2])
-    assert('PR interval' in rest[3])
-    assert('QRS duration' in rest[4])
-    assert('QT/QTc' in rest[5])
-    assert('P-R-T axes' in rest[6])
-    assert('yr' in rest[7])
-    assert('ale' in rest[8])
-
-    rate = split_newline(rest[2])[1]
-    PR = split_newline(rest[3])[1]
-    QRSD = split_newline(rest[4])[1]
-    QT, QTc = split_newline(rest[5])[2].split('/')
-    TAxis = split_newline(rest[6])[0]
-    QRSAxis = split_newline(rest[6])[1]
-    PAxis = split_newline(rest[6])[2]
-    age = parse_age(split_newline(rest[7])[0])
-    gender = parse_gender(split_newline(rest[8])[0])
+    # extract descriptions (the blocks between the patient id and the first 'mm/s')
+    interpretation = [{"Diagnosis": d[:-1]} for d in subtext[indices['id'] + 1:indices['speed']]]
+
+    rate = split_newline(subtext[indices['rate']])[1]
+    PR = split_newline(subtext[indices['PR']])[1]
+    QRSD = split_newline(subtext[indices['QRS']])[1]
+    QT, QTc = split_newline(subtext[indices['QT']])[2].split('/')
+    TAxis, QRSAxis, PAxis = split_newline(subtext[indices['axes']])[:3]
+    age = parse_age(split_newline(subtext[indices['age']])[0])
+    gender = parse_gender(split_newline(subtext[indices['gender']])[0])
 
     feature_dct = {
         "patient_id": patient_id,
@@ -158,45 +159,362 @@ def get_values_pdf(path):
 
     return feature_dct, missing_lead2
 
-def read_waves_pdf(filename):
-    doc = fitz.open(filename)
-    page = doc.load_page(0)
-    svg = page.get_svg_image(matrix=fitz.Identity, text_as_path=False)
-    wave, freq = get_svg_data('S', svg)
+def read_waves_pdf(filename, engine='svg', mode='S', page_number=0):
+    with fitz.open(filename) as doc:
+        page = doc.load_page(page_number)
+        return read_waves_page(page, engine, mode)
+
+def read_waves_page(page, engine='svg', mode='S'):
+    '''
+    engine : 'svg' renders the page to svg and parses it (parsing.get_svg_data)
+             'drawings' reads the vector paths of the page directly (see 'get_drawing_data')
+    mode : vendor, layout profile or 'auto' (see parsing.candidate_profiles)
+    '''
+    if engine == 'drawings':
+        return get_drawing_data(mode, page)
+
+    with timer('get_svg_image'):
+        svg = page.get_svg_image(matrix=fitz.Identity, text_as_path=False)
+    wave, freq = get_svg_data(mode, svg)
 
     return wave, freq
 
+def drawing_vertices(drawing):
+    '''
+    converts a path of page.get_drawings() to an (n, 2) array of vertices,
+    counted the same way parsing.parse_path counts the vertices of the corresponding svg path
+    (exact for open paths such as the leads and calibration markers; closed paths may differ by one vertex)
+    '''
+    items = drawing['items']
+    closed = drawing.get('closePath')
+
+    # fast path for open polylines (the leads and the calibration markers)
+    if not closed and all(item[0] == 'l' for item in items):
+        p1 = np.array([(item[1].x, item[1].y) for item in items])
+        p2 = np.array([(item[2].x, item[2].y) for item in items])
+        if np.array_equal(p1[1:], p2[:-1]):
+            return np.concatenate([p1[:1], p2])
+
+    verts = []
+    start = current = None
+    for item in items:
+        kind = item[0]
+        if kind in ('l', 'c'):
+            if item[1] != current: # implicit moveto
+                start = item[1]
+                verts.append(start)
+            verts.append(item[2]) # parse_path keeps the first point of each command (the first control point of a curve)
+            current = item[-1]
+        else: # 're' or 'qu': closed subpath of four corners
+            if kind == 're':
+                corners = [item[1].tl, item[1].tr, item[1].br, item[1].bl]
+            else:
+                corners = [item[1].ul, item[1].ur, item[1].lr, item[1].ll]
+            verts.extend(corners + corners[:1] * 2)
+            start = current = None
+
+    if closed and start is not None:
+        if current != start:
+            verts.append(start)
+        verts.append(start)
+
+    return np.array([(p.x, p.y) for p in verts])
+
+def get_drawing_data(mode, page):
+    '''
+    same output as parsing.get_svg_data(mode, page.get_svg_image(...)) without rendering and re-parsing svg
+    - page.get_drawings() returns page coordinates (y pointing down, scaled by the content stream),
+      while the svg keeps the untransformed user coordinates,
+      so the vertices are mapped back using the known height of the calibration markers
+    - output matches the svg engine up to the float32 precision of the drawing coordinates
+    '''
+    with timer('get_drawings'):
+        result = [drawing_vertices(drawing) for drawing in page.get_drawings() if drawing['items']]
+    name = detect_profile([len(el) for el in result], mode)
+    if name is None:
+        raise NoProfileError('no layout profile matches the paths of the page')
+    num_base, gap = BASE_MARKERS[LAYOUT_PROFILES[name]['vendor']]
+
+    markers = [el for el in result if len(el) == num_base]
+    assert len(markers) > 0
+    marker = markers[0]
+    # signed scale between user and page y coordinates: the marker rises by 'gap' user units from its first vertex
+    extreme = marker[np.argmax(np.abs(marker[:, 1] - marker[0, 1])), 1]
+    scale = (extreme - marker[0, 1]) / gap
+
+    result = [el / [abs(scale), scale] for el in result]
+
+    return get_path_data(name, result)
+
+def read_pdf(path, engine='svg', mode='S', page_number=0):
+    '''
+    opens the pdf and loads the page once (page 0 by default), and extracts both features and waves from it
+    output : feature_dct, missing_lead2, wave, freq (wave and freq are None when 10s lead 2 is missing)
+    - only the layouts with the 10s rhythm strip require it (see parsing.has_rhythm_strip): a page without its label
+      is skipped when its profile has a rhythm strip or when no profile matches (e.g. old 3x4 pages),
+      and extracted when it has another layout (e.g. 6x2 or 12x1)
+    '''
+    assert(path.lower().endswith('.pdf'))
+
+    with stage('open'), timer('fitz.open', os.path.getsize(path)):
+        doc = fitz.open(path)
+    with doc:
+        with stage('open'):
+            page = doc.load_page(page_number)
+        with stage('features'):
+            feature_dct, missing_lead2 = get_values_page(page, path)
+
+        # pass the case when pdf does not contain 10s lead 2, without parsing the paths when every profile requires it
+        if missing_lead2 and all(has_rhythm_strip(name) for name in candidate_profiles(mode)):
+            return feature_dct, missing_lead2, None, None
+
+        with stage('waves'):
+            try:
+                wave, freq = read_waves_page(page, engine, mode)
+            except NoProfileError:
+                if not missing_lead2:
+                    raise
+                wave = None
+
+        # the rhythm strip is the first of parsing.LEADS, empty for the layouts without it
+        if missing_lead2 and (wave is None or len(wave[0])):
+            return feature_dct, missing_lead2, None, None
+
+    return feature_dct, False, wave, freq
+
 def upsampling(wave, factor=2):
+    # single lead version of resample_module.resample (kept as reference, see benchmark.py)
     x = np.arange(0,len(wave), 1)
     f = scipy.interpolate.interp1d(x,wave, fill_value='extrapolate', kind='quadratic')
     xnew = np.arange(0,len(wave),1/factor)
     return f(xnew) 
 
-def waves_and_features(directory):
+def extract_pdf(pdf, engine='svg', mode='S', page_number=0):
     '''
-    input : directory that contains n-pdfs 
+    extracts (wave, feature_dct) from a single pdf (from its page page_number)
+    returns None when the pdf does not contain 10s lead 2
+    '''
+    # extract features and wave from a single open of the pdf
+    feature_dct, missing_lead2, wave, freq = read_pdf(pdf, engine, mode, page_number)
+
+    # pass the case when pdf does not contain 10s lead 2
+    if missing_lead2:
+        return None
+
+    # when freq is not 500Hz (e.g. 250Hz), we resample to 500Hz
+    if freq != TARGET_FREQ:
+        with stage('resample'):
+            wave = resample(wave, freq, TARGET_FREQ)
+
+    return wave, feature_dct
+
+def extract_pdf_cached(pdf, engine='svg', mode='S', cache_dir=None, page_number=0):
+    '''
+    extract_pdf, reusing the result cached for the same file content, extractor version and options (see cache_module)
+    '''
+    result = cached(extract_pdf, pdf, cache_dir, engine, mode, page_number)
+    if result is None:
+        return None
+    # the entry may have been stored by a copy of the pdf under another name, the file name comes from this path
+    wave, feature_dct = result
+    return wave, dict(feature_dct, file_name=pdf.split('/')[-1])
+
+def iter_pdf_pages(pdfs):
+    '''
+    yields (pdf, page_number) for every page of the pdfs, each pdf being opened only to read its page count
+    (the pages are told apart from the text-only pages by the workers, see 'extract_pdf_page'),
+    and (pdf, None) for the pdfs without page, recorded as 'no_ecg_pages' by 'extract_pdf_page'
+    pdfs that can't be opened are yielded as (pdf, 0), the failure is reported by their extraction
+    '''
+    for pdf in pdfs:
+        try:
+            with fitz.open(pdf) as doc:
+                page_count = doc.page_count
+        except Exception:
+            yield pdf, 0
+            continue
+        if page_count == 0:
+            yield pdf, None
+        for page_number in range(page_count):
+            yield pdf, page_number
+
+def extract_pdf_page(item, engine='svg', mode='S', cache_dir=None):
+    '''
+    'extract_pdf_cached' of a (pdf, page_number) item of 'iter_pdf_pages', the page number is added to the features
+    pages without the header of an ECG report (reports, notes or scanned pages of combined exports) are recorded as 'not_ecg_page'
+    '''
+    pdf, page_number = item
+    if page_number is None:
+        raise Skipped('no_ecg_pages')
+    try:
+        result = extract_pdf_cached(pdf, engine, mode, cache_dir, page_number)
+    except StageError as error:
+        if isinstance(error.__cause__, HeaderNotFoundError):
+            raise Skipped('not_ecg_page') from error
+        raise
+    if result is None:
+        return None
+    wave, feature_dct = result
+    return wave, dict(feature_dct, page=page_number)
+
+def iter_waves_and_features(directory, workers=1, chunksize=1, max_in_flight=None, ordered=True, engine='svg', mode='S',
+                            cache_dir=None, cache_max_bytes=None, on_error='raise', manifest=None, resume=False,
+                            pattern=None, recursive=False, shard=None, stats=None, pending=None):
+    '''
+    iterator version of 'waves_and_features' (same arguments)
+    yields (filename, wave, feature_dct, status) for each pdf as soon as it is extracted, where status is
+    'ok', 'missing_lead2' (wave and feature_dct are None), or
+    'error' (only with on_error='record'; wave is None and feature_dct is the error record {'stage', 'reason'})
+    - on_error, manifest, resume, stats, pending: see batch_module.iter_records
+    - pattern, recursive, shard: which pdfs of directory to extract (see file_module.iter_files),
+      the directory is walked lazily, so extraction starts before the listing is complete
+    '''
+    pdfs = iter_files(directory, ('.pdf',), pattern, recursive, shard)
+    extract = functools.partial(extract_pdf_cached, engine=engine, mode=mode, cache_dir=cache_dir)
+    records = iter_records(extract, pdfs, workers, chunksize, max_in_flight, ordered, on_error,
+                           'missing_lead2', manifest, resume, stats, pending)
+
+    for pdf, status, result in records:
+        if status == 'ok':
+            wave, feature_dct = result
+        else:
+            wave, feature_dct = None, result
+        yield pdf, wave, feature_dct, status
+
+    if cache_dir is not None and cache_max_bytes is not None:
+        cache_evict(cache_dir, cache_max_bytes)
+
+def waves_and_features(directory, workers=1, chunksize=1, max_in_flight=None, ordered=True, engine='svg', mode='S',
+                       cache_dir=None, cache_max_bytes=None, on_error='raise', manifest=None, resume=False,
+                       pattern=None, recursive=False, shard=None):
+    '''
+    input : directory that contains n-pdfs (sub-directories are only searched with recursive=True)
     output : list of waves, features of length n 
+    - workers > 1 fans the extraction out to a process pool (None: one process per core)
+    - chunksize, max_in_flight: pdfs per task and maximum pdfs submitted at once (see batch_module.imap_bounded)
+    - ordered: keep the order of the directory listing; if False, results are collected as they complete
+    - engine: waveform engine, 'svg' or 'drawings' (see 'read_waves_page')
+    - mode: vendor, layout profile or 'auto' to detect the layout of each pdf (see parsing.detect_profile)
+    - cache_dir: directory of the extraction cache, only new or changed pdfs are extracted (None: no cache)
+    - cache_max_bytes: size of the cache kept after the run, least recently used entries are evicted first
+    - on_error, manifest, resume: fault tolerant / resumable batches (see 'iter_waves_and_features'),
+      failed pdfs are left out of the output
+    - pattern, recursive, shard: glob pattern of the file names, also walk sub-directories (default: only the pdfs
+      directly in directory), (i, n) to only extract the i-th of n disjoint parts of the directory (see file_module.iter_files)
     '''
-    filenames = filenames_in(directory)
     waves, features = [], []
 
     # read pdf files
-    for filename in filenames:
-        pdf = filename + '.pdf'
-        # extract features
-        feature_dct, missing_lead2 = get_values_pdf(pdf)
-        
+    for _, wave, feature_dct, status in iter_waves_and_features(directory, workers, chunksize, max_in_flight, ordered,
+                                                                engine, mode, cache_dir, cache_max_bytes,
+                                                                on_error, manifest, resume,
+                                                                pattern, recursive, shard):
         # pass the case when pdf does not contain 10s lead 2
-        if not missing_lead2:
-            # read wave
-            wave, freq = read_waves_pdf(pdf)
-            
-            # when freq is 250Hz, we upsample to 500Hz
-            if freq == 250:
-                for i in range(13):
-                    wave[i] = upsampling(wave[i], factor=2)
-
+        if status == 'ok':
             waves.append(wave)
             features.append(feature_dct)
 
-    return waves, features
\ No newline at end of file
+    return waves, features
+
+def waves_and_features_to_dataset(directory, out_dir, dtype='float32', workers=1, chunksize=1, max_in_flight=None,
+                                  ordered=True, engine='svg', mode='S', cache_dir=None, cache_max_bytes=None,
+                                  on_error='raise', manifest=None, resume=False, pattern=None, recursive=False, shard=None):
+    '''
+    same as 'waves_and_features', but streams the results to a memory-mapped dataset in out_dir
+    instead of keeping them in memory (see dataset_module.write_dataset)
+    with resume, the records of this run are written to out_dir if it is empty, otherwise to a new out_dir/part-N
+    (see dataset_module.part_dir), so the records of the previous runs are kept
+    output : number of records written
+    '''
+    pdfs = iter_files(directory, ('.pdf',), pattern, recursive, shard)
+    n_pdfs = count_pending(pdfs, manifest) if resume else sum(1 for _ in pdfs)
+    # the manifest records of the pdfs done are only written once their records are saved
+    pending = []
+    records = iter_waves_and_features(directory, workers, chunksize, max_in_flight, ordered,
+                                      engine, mode, cache_dir, cache_max_bytes, on_error, manifest, resume,
+                                      pattern, recursive, shard, pending=pending)
+    results = ((wave, feature_dct) if status == 'ok' else None for _, wave, feature_dct, status in records)
+
+    if resume:
+        out_dir = part_dir(out_dir)
+    on_flush = functools.partial(commit_manifest, manifest, pending)
+    return write_dataset(results, out_dir, n_pdfs, dtype=dtype, on_flush=on_flush)
+
+def scan_pdf(path, clip=None):
+    '''
+    metadata only version of 'extract_pdf': reads the text of page 0, without rendering or parsing the waves
+    clip: (x0, y0, x1, y1) fractions of the page of the header region to read (None: the whole page)
+    output : row of the index table (features, 'file' and 'missing_lead2')
+    '''
+    with stage('open'):
+        doc = fitz.open(path)
+    with doc:
+        with stage('open'):
+            page = doc.load_page(0)
+        with stage('features'):
+            if clip is not None:
+                x0, y0, x1, y1 = clip
+                rect = page.rect
+                clip = fitz.Rect(rect.x0 + x0 * rect.width, rect.y0 + y0 * rect.height,
+                                 rect.x0 + x1 * rect.width, rect.y0 + y1 * rect.height)
+            feature_dct, missing_lead2 = get_values_page(page, path, clip)
+
+    return feature_row(dict(feature_dct, file=path, missing_lead2=missing_lead2))
+
+def scan_metadata(directory, index_path, workers=None, chunksize=16, max_in_flight=None, clip=None,
+                  on_error='record', manifest=None, resume=False, pattern=None, recursive=False, shard=None,
+                  stats=None, batch_size=1024):
+    '''
+    writes the index table of the pdfs in directory (one row per pdf, see 'scan_pdf') to index_path,
+    a .csv, .jsonl or .parquet file (see dataset_module.write_table), without extracting the waves
+    - other arguments: see 'iter_waves_and_features' (results are written in completion order),
+      with resume the rows of the new pdfs are appended to index_path (not a .parquet file)
+    output : number of rows written
+    '''
+    pdfs = iter_files(directory, ('.pdf',), pattern, recursive, shard)
+    scan = functools.partial(scan_pdf, clip=clip)
+    pending = []
+    records = iter_records(scan, pdfs, workers, chunksize, max_in_flight, False, on_error,
+                           'skipped', manifest, resume, stats, pending)
+    return write_table((row if status == 'ok' else None for _, status, row in records), index_path, batch_size,
+                       append=resume, on_flush=functools.partial(commit_manifest, manifest, pending))
+
+def iter_page_waves_and_features(directory, workers=1, chunksize=1, max_in_flight=None, ordered=True, engine='svg',
+                                 mode='S', cache_dir=None, cache_max_bytes=None, on_error='raise', manifest=None,
+                                 resume=False, pattern=None, recursive=False, shard=None, stats=None):
+    '''
+    page-level version of 'iter_waves_and_features' for pdfs holding several ECGs (one per page, e.g. serial tracings)
+    yields ((filename, page_number), wave, feature_dct, status) for every page of every pdf, with status 'not_ecg_page'
+    (wave and feature_dct None) for the pages without ECG report (e.g. scanned or text-only pages),
+    and ((filename, None), None, None, 'no_ecg_pages') for the pdfs without page
+    - the pages are listed lazily in the main process (see 'iter_pdf_pages') and both detected and extracted on the process pool,
+      each worker opening its own handle of the document (PyMuPDF documents can't be shared between processes or threads),
+      so the pages of a single large pdf are extracted concurrently
+    - the manifest records the page of every item, and resume skips the pages already done
+    '''
+    pages = iter_pdf_pages(iter_files(directory, ('.pdf',), pattern, recursive, shard))
+    extract = functools.partial(extract_pdf_page, engine=engine, mode=mode, cache_dir=cache_dir)
+    records = iter_records(extract, pages, workers, chunksize, max_in_flight, ordered, on_error,
+                           'missing_lead2', manifest, resume, stats)
+
+    for item, status, result in records:
+        if status == 'ok':
+            wave, feature_dct = result
+        else:
+            wave, feature_dct = None, result
+        yield item, wave, feature_dct, status
+
+    if cache_dir is not None and cache_max_bytes is not None:
+        cache_evict(cache_dir, cache_max_bytes)
+
+def page_waves_and_features(directory, **options):
+    '''
+    input : directory that contains pdfs with one or more ECG pages
+    output : {(filename, page_number): (wave, feature_dct)} of the ECG pages with 10s lead 2
+    - options: see 'iter_page_waves_and_features'
+    '''
+    return {
+        item: (wave, feature_dct)
+        for item, wave, feature_dct, status in iter_page_waves_and_features(directory, **options)
+        if status == 'ok'
+    }
@@ -0,0 +1,110 @@
+'''
+Instrumentation of the extraction pipeline
+- 'timer(name, nbytes)' times a block and adds it to the statistics of this process:
+  number of calls, wall time, bytes processed and, while tracemalloc is tracing, memory allocated and peak memory
+- timers nest (e.g. the 'waves' stage contains 'get_svg_image', 'get_attrib', 'parse_path' and 'assemble'),
+  a timer includes the time of the timers run inside it
+- the batch drivers collect the statistics of every file in the workers and merge them in the parent
+  (see batch_module.iter_records); 'write_stats' exports them as json to compare runs
+'''
+import os
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+import contextlib
+
+STATS = {}   # name -> statistics of the timer in this process since the last 'pop_stats'
+_PEAKS = []   # [memory at the start, peak seen in nested timers] of the timers being run, while tracing
+
+def _record(name, seconds, nbytes, allocated=None, peak=None):
+    stats = STATS.setdefault(name, {'count': 0, 'seconds': 0, 'bytes': 0})
+    stats['count'] += 1
+    stats['seconds'] += seconds
+    stats['bytes'] += nbytes
+    if allocated is not None:
+        stats['allocated'] = stats.get('allocated', 0) + allocated
+        stats['peak'] = max(stats.get('peak', 0), peak)
+
+@contextlib.contextmanager
+def timer(name, nbytes=0):
+    '''
+        adds the wall time of the block (and its allocations, while tracing) to STATS[name]
+        nbytes: size of the input processed by the block
+    '''
+    if not tracemalloc.is_tracing():
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _record(name, time.perf_counter() - start, nbytes)
+        return
+
+    # the peak of tracemalloc is reset for every timer, the peak of the enclosing timer is kept in _PEAKS
+    current, peak = tracemalloc.get_traced_memory()
+    if _PEAKS:
+        _PEAKS[-1][1] = max(_PEAKS[-1][1], peak)
+    _PEAKS.append([current, 0])
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        begin, nested_peak = _PEAKS.pop()
+        peak = max(peak, nested_peak)
+        if _PEAKS:
+            _PEAKS[-1][1] = max(_PEAKS[-1][1], peak)
+        _record(name, seconds, nbytes, current - begin, peak - begin)
+
+def pop_stats():
+    stats = dict(STATS)
+    STATS.clear()
+    return stats
+
+def merge_stats(total, stats):
+    '''
+        adds the statistics of one file (from 'pop_stats') to the statistics of a batch,
+        where 'files' counts the files that ran each timer
+    '''
+    for name, values in stats.items():
+        merged = total.setdefault(name, {'files': 0, 'count': 0, 'seconds': 0, 'bytes': 0})
+        merged['files'] += 1
+        for key in ('count', 'seconds', 'bytes', 'allocated'):
+            if key in values:
+                merged[key] = merged.get(key, 0) + values[key]
+        if 'peak' in values:
+            merged['peak'] = max(merged.get('peak', 0), values['peak'])
+
+def start_tracing():
+    '''
+        traces the allocations of this process and of the worker processes started afterwards
+    '''
+    os.environ['PYTHONTRACEMALLOC'] = '1'
+    tracemalloc.start()
+
+@contextlib.contextmanager
+def profiled(path=None, top=30):
+    '''
+        runs the block under cProfile, saves the profile to path (readable with pstats / snakeviz),
+        or prints the top functions by cumulative time when path is None
+    '''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+def write_stats(path, stats, **meta):
+    '''
+        writes the statistics of a batch to a json file, together with meta (e.g. arguments, extractor version)
+    '''
+    with open(path, 'w') as file:
+        json.dump(dict(meta, time=time.strftime('%Y-%m-%dT%H:%M:%S'), stats=stats), file, indent=1)
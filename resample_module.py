@@ -0,0 +1,57 @@
+'''
+Batched resampling of ECG leads
+- same output as pdf_module.upsampling (scipy.interpolate.interp1d(kind='quadratic', fill_value='extrapolate'))
+  for any source and target rate: the interpolating spline is linear in the samples, so for a given number of samples
+  and rate ratio it reduces to two fixed sparse operators, computed once and applied to all the leads of that length at once
+    coefficients = collocation^-1 @ samples   (sparse LU factorization of the banded collocation matrix)
+    output = design @ coefficients            (values of the B-splines at the new sample positions)
+- downsampling evaluates the spline at the new positions without anti-aliasing filter
+  (for integer ratios, e.g. 1000 -> 500 Hz, it returns every other sample up to rounding)
+'''
+import functools
+import numpy as np
+import scipy.interpolate
+import scipy.sparse.linalg
+
+@functools.lru_cache(maxsize=64)
+def resampling_operators(n, src_rate, dst_rate, k=2):
+    '''
+        (design matrix, LU factorization of the collocation matrix) of the degree k interpolating spline
+        of n samples at src_rate, evaluated at the sample positions of dst_rate
+    '''
+    x = np.arange(n)
+    # knots of the spline interp1d builds (make_interp_spline with the default boundary conditions)
+    knots = scipy.interpolate.make_interp_spline(x, np.zeros(n), k=k).t
+    collocation = scipy.interpolate.BSpline.design_matrix(x, knots, k).tocsc()
+    n_out = int(np.ceil(n * dst_rate / src_rate))
+    x_new = np.arange(n_out) * (src_rate / dst_rate)
+    design = scipy.interpolate.BSpline.design_matrix(x_new, knots, k, extrapolate=True).tocsr()
+    return design, scipy.sparse.linalg.splu(collocation)
+
+def resample_stack(stack, src_rate, dst_rate):
+    '''
+        resamples the rows of an (n_leads, n) array, returns an (n_leads, n * dst_rate / src_rate) array
+    '''
+    stack = np.asarray(stack, dtype=float)
+    design, collocation = resampling_operators(stack.shape[1], src_rate, dst_rate)
+    return np.ascontiguousarray((design @ collocation.solve(np.ascontiguousarray(stack.T))).T)
+
+def resample(waves, src_rate, dst_rate):
+    '''
+        resamples a list of leads (possibly of different lengths, e.g. short leads and the 10s rhythm strip)
+        leads of the same length are resampled together, the output keeps the order of the input
+        empty leads (missing from the layout, see parsing.LEADS) are returned as they are
+    '''
+    if src_rate == dst_rate:
+        return list(waves)
+
+    by_length = {}
+    for i, lead in enumerate(waves):
+        if len(lead):
+            by_length.setdefault(len(lead), []).append(i)
+
+    output = list(waves)
+    for indices in by_length.values():
+        for i, lead in zip(indices, resample_stack([waves[i] for i in indices], src_rate, dst_rate)):
+            output[i] = lead
+    return output
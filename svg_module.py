@@ -3,25 +3,28 @@
     last updated: 211201
 '''
 import re
-import os
 import json
 from tqdm import tqdm
+import functools
+from batch_module import describe, stage, iter_records, new_stats, commit_manifest
+from dataset_module import write_table, feature_row
+from file_module import iter_files
 
-def svg_file_paths(directory):
-    return [os.path.join(dir,f) for dir, _, files in os.walk(directory) for f in files if f.endswith('.svg')]
+TAG_DELIMITERS = re.compile('>|<')
+
+def svg_file_paths(directory, pattern=None, shard=None):
+    return list(iter_files(directory, ('.svg',), pattern, shard=shard))
 
 def all_tspans(path):
     '''
         returns all tspan elements from given svg file
     '''
-    file = open(path, "r")
     tspans = []
+    with open(path, "r") as file:
+        for line in file:
+            if 'id="tspan' in line:
+                tspans.append(TAG_DELIMITERS.split(line, 2)[1])
 
-    file.seek(0)
-    for line in file:
-        if 'id="tspan' in line:
-            tspans.append(re.split('>|<', line)[1])
-            
     return tspans
 
 def parse_age(string):
@@ -67,7 +70,7 @@ def get_values(path):
         extracts features from the given svg file and returns them as a dictionary
     '''
     # extract file_name
-    assert(path.endswith('.svg'))
+    assert(path.lower().endswith('.svg'))
     file_name = path.split('/')[-1]
 
     # skip tspans which are leadnames ('I','II', etc.)
@@ -122,22 +125,69 @@ def get_values(path):
     }
     return feature_dct
 
+def extract_svg(path):
+    '''
+        get_values, failures reported as the 'features' stage (see batch_module.stage)
+    '''
+    with stage('features'):
+        return get_values(path)
+
 def svg_to_json(directory):
     '''
         saves json file next to each svg file contained in the directory
     '''
     for svg_file_path in tqdm(svg_file_paths(directory)):
         try:
-            json_file_path = svg_file_path[:-3] + 'json'
-            assert(json_file_path.endswith('.json'))
+            write_sidecar(svg_file_path, get_values(svg_file_path))
+        except Exception as error:
+            print(f'failed for {svg_file_path}: {describe(error)}')
+
+def write_sidecar(svg_file_path, feature_dct):
+    json_file_path = svg_file_path[:-3] + 'json'
+    assert(json_file_path.endswith('.json'))
+    with open(json_file_path, 'w') as file:
+        file.write(json.dumps(feature_dct))
 
-            feature_dct = get_values(svg_file_path)
-            with open(json_file_path, 'w') as file:
-                json_string = json.dumps(feature_dct)
-                file.write(json_string)
+def extract_svg_record(path, sidecar=False):
+    '''
+        extract_svg, also saving the json file next to the svg file if sidecar
+    '''
+    feature_dct = extract_svg(path)
+    if sidecar:
+        with stage('sidecar'):
+            write_sidecar(path, feature_dct)
+    return feature_dct
 
-        except:
-            print(f'failed for {svg_file_path}')
+def svg_to_jsonl(directory, out_path, workers=None, chunksize=16, max_in_flight=None, sidecar=False,
+                 manifest=None, resume=False, pattern=None, shard=None, batch_size=1024):
+    '''
+        parallel version of 'svg_to_json': writes the features of every svg file contained in the directory
+        to a single file out_path (.jsonl, or .parquet / .csv with the interpretation stored as json), in batches
+        - workers, chunksize, max_in_flight: see batch_module.imap_bounded (workers=1 runs serially)
+        - sidecar: also save the json file next to each svg file, as 'svg_to_json' does
+        - manifest, resume: jsonl record of every file, with the stage and reason of the failures (see batch_module.iter_records),
+          with resume the features of the new files are appended to out_path (not a .parquet file)
+        output : number of records written, and the batch statistics (see batch_module.update_stats)
+    '''
+    stats = new_stats()
+    svgs = iter_files(directory, ('.svg',), pattern, shard=shard)
+    extract = functools.partial(extract_svg_record, sidecar=sidecar)
+    pending = []   # manifest records of the files done, written once their features are saved
+    records = iter_records(extract, svgs, workers, chunksize, max_in_flight, False, 'record',
+                           manifest=manifest, resume=resume, stats=stats, pending=pending)
+
+    flatten = not out_path.endswith('.jsonl')
+
+    def rows():
+        for svg_file_path, status, result in records:
+            if status == 'error':
+                print(f'failed for {svg_file_path}: {result["stage"]}: {result["reason"]}')
+                continue
+            yield feature_row(result) if flatten else result
+
+    count = write_table(rows(), out_path, batch_size, append=resume,
+                        on_flush=functools.partial(commit_manifest, manifest, pending))
+    return count, stats
 
 # %%
 # directory = '/mount/inf_gatekeeper/Data/Combined_ECGs' # 11703 it
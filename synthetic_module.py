@@ -0,0 +1,268 @@
+'''
+Synthetic ECG inputs with known content, for benchmarks and golden-output checks (real patient files can't be shared)
+- svg: calibration markers and lead polylines of a layout profile, as rendered by page.get_svg_image
+- pdf: the same paths drawn in the content stream of a page, with the header text read by pdf_module.get_values_page
+- xml: Philips xml with an XLI-encoded 'parsedwaveforms' node and the header read by xml_module.read_xml_SNUB
+each generator also returns the expected output of the extractor
+'''
+import os
+import base64
+import numpy as np
+import fitz
+from parsing import BASE_MARKERS, LEADS, LAYOUTS, LAYOUT_PROFILES, has_rhythm_strip
+
+def synthetic_page(profile='S_3x4+1_500', seed=0):
+    '''
+        returns (paths, waves): the vertices of every path of a page of the given layout profile
+        (grid lines, one calibration marker per row, leads) in svg user units,
+        and the waves get_path_data extracts from them, in the order of LEADS
+    '''
+    rng = np.random.default_rng(seed)
+    profile = LAYOUT_PROFILES[profile]
+    layout = LAYOUTS[profile['layout']]
+    num_base, gap = BASE_MARKERS[profile['vendor']]
+    n_rows = max(row for _, row, _ in layout) + 1
+    bases = [2000 + 2000 * (n_rows - 1 - row) for row in range(n_rows)]
+
+    # grid lines, skipped by the extraction
+    paths = [[(0, y), (13000, y)] for y in range(0, bases[0] + 2000, 500)]
+    for base in bases:
+        paths.append([(200, base)] + [(210 + i, base + gap if 0 < i < num_base - 2 else base) for i in range(num_base - 1)])
+
+    waves = {}
+    for (lead, row, col), length in zip(layout, profile['lengths']):
+        wave = np.cumsum(rng.integers(-20, 21, length))
+        wave = np.clip(wave - wave[0], -600, 600)
+        x0 = 600 + col * 2 * (length + 50)
+        paths.append([(x0 + 2 * i, bases[row] + int(y)) for i, y in enumerate(wave)])
+        waves[lead] = wave.astype(float)
+    return paths, [waves.get(lead, np.empty(0)) for lead in LEADS]
+
+def svg_path(vertices):
+    return 'M ' + ' L '.join(f'{x} {y}' for x, y in vertices)
+
+def synthetic_svg(profile='S_3x4+1_500', seed=0):
+    '''
+        returns (svg, waves), with paths written like the output of PyMuPDF 1.19 page.get_svg_image
+    '''
+    paths, waves = synthetic_page(profile, seed)
+    body = '\n'.join(f'<path transform="matrix(.06,0,0,-.06,0,595)" fill="none" stroke="#000000" d="{svg_path(vertices)}"/>'
+                     for vertices in paths)
+    return f'<svg xmlns="http://www.w3.org/2000/svg" width="842" height="595">\n{body}\n</svg>', waves
+
+def synthetic_features(file_name, seed=0):
+    '''
+        header values of a synthetic pdf, as returned by pdf_module.get_values_page
+    '''
+    rng = np.random.default_rng(seed)
+    QT = int(rng.integers(340, 420))
+    return {
+        'patient_id': str(rng.integers(10000000, 99999999)),
+        'file_name': file_name,
+        'study_date': f'20{rng.integers(10, 22)}-05-{rng.integers(10, 28)}',
+        'study_time': f'{rng.integers(10, 23)}:{rng.integers(10, 59)}:{rng.integers(10, 59)}',
+        'gender': ['MALE', 'FEMALE'][rng.integers(2)],
+        'age': str(rng.integers(20, 90)),
+        'Heart rate': str(rng.integers(50, 110)),
+        'PR Interval': str(rng.integers(120, 200)),
+        'QRS Interval': str(rng.integers(80, 120)),
+        'QT Interval': str(QT),
+        'QTc Interval': str(QT + 20),
+        'P Axis': str(rng.integers(0, 90)),
+        'QRS Axis': str(rng.integers(-30, 90)),
+        'T Axis': str(rng.integers(0, 90)),
+        'interpretation': [{'Diagnosis': 'Sinus rhythm'}, {'Diagnosis': 'Normal ECG'}],
+    }
+
+def header_blocks(features, lead2=True, layout='3x4+1'):
+    '''
+        text blocks of the page, in the order get_values_page expects them:
+        the lead names of the layout (with the label 'II' of the rhythm strip last, unless lead2 is False), then the header
+    '''
+    year, month, day = features['study_date'].split('-')
+    month = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'][int(month) - 1]
+    gender = features['gender'].capitalize()
+    leads = {lead for lead, _, _ in LAYOUTS[layout]}
+    names = [lead for lead in LEADS if lead in leads and lead != 'II rhythm']
+    if 'II rhythm' in leads and lead2:
+        names.append('II')
+    return names + [
+        f'DOE^JOHN\nID:{features["patient_id"]}\n{day}-{month}-{year}  {features["study_time"]}',
+        *[diagnosis['Diagnosis'] for diagnosis in features['interpretation']],
+        '25 mm/s  10 mm/mV',
+        '100 Hz',
+        f'Vent. rate\n{features["Heart rate"]}\nBPM',
+        f'PR interval\n{features["PR Interval"]}\nms',
+        f'QRS duration\n{features["QRS Interval"]}\nms',
+        f'QT/QTc\nms\n{features["QT Interval"]}/{features["QTc Interval"]}',
+        f'{features["T Axis"]}\n{features["QRS Axis"]}\n{features["P Axis"]}\nP-R-T axes',
+        f'{features["age"]} yr',
+        gender,
+    ]
+
+def draw_page(doc, paths, features, lead2=True, layout='3x4+1', width=842, height=595):
+    '''
+        adds a page with the given paths (drawn in the content stream) and the header text of features to doc
+    '''
+    scale = min(0.06, (height - 40) / max(y for vertices in paths for _, y in vertices))
+    lines = ['q', f'{scale} 0 0 {scale} 0 0 cm', '1 w']
+    for vertices in paths:
+        lines.append(f'{vertices[0][0]} {vertices[0][1]} m')
+        lines.extend(f'{x} {y} l' for x, y in vertices[1:])
+        lines.append('S')
+    lines.append('Q')
+
+    page = doc.new_page(width=width, height=height)
+    page.draw_line((0, 0), (1, 1))  # creates the content stream, replaced by the paths
+    doc.update_stream(page.get_contents()[0], '\n'.join(lines).encode())
+
+    # one block per text, separated enough not to be merged by the text extraction
+    x, y = 20, 20
+    for text in header_blocks(features, lead2, layout):
+        n_lines = text.count('\n') + 1
+        if y + 9 * n_lines > height - 15:
+            x, y = x + 300, 20
+        page.insert_text((x, y + 7), text, fontsize=7)
+        y += 9 * n_lines + 10
+
+def synthetic_pdf(path, profile='S_3x4+1_500', seed=0, lead2=True):
+    '''
+        writes a one page pdf and returns (waves, features) expected from it
+        the lead names of the page are those of the layout of the profile; with lead2 False, the label of the rhythm strip
+        is left out as in some old pdfs, and the waves are None for the layouts with a rhythm strip (see pdf_module.read_pdf)
+    '''
+    paths, waves = synthetic_page(profile, seed)
+    features = synthetic_features(os.path.basename(path), seed)
+    with fitz.open() as doc:
+        draw_page(doc, paths, features, lead2, LAYOUT_PROFILES[profile]['layout'])
+        doc.save(path)
+    return (None if not lead2 and has_rhythm_strip(profile) else waves), features
+
+def synthetic_multipage_pdf(path, n_ecgs=4, profile='S_3x4+1_500', seed=0):
+    '''
+        writes a pdf of n_ecgs ECG pages, each followed by a text-only page (e.g. a report), as in combined exports
+        returns {page_number: (waves, features)} of the ECG pages
+    '''
+    expected = {}
+    with fitz.open() as doc:
+        for i in range(n_ecgs):
+            paths, waves = synthetic_page(profile, seed + i)
+            features = synthetic_features(os.path.basename(path), seed + i)
+            expected[doc.page_count] = (waves, features)
+            draw_page(doc, paths, features, layout=LAYOUT_PROFILES[profile]['layout'])
+            doc.new_page().insert_text((72, 72), f'Report {i + 1}: confirmed by Dr. Doe')
+        doc.save(path)
+    return expected
+
+def LZW_compress(data, dictionary_size=256, max_code=1024):
+    '''
+        LZW compressor matching xml_module.LZW_decompress (codes never exceed max_code - 1)
+    '''
+    dictionary = {bytes([i]): i for i in range(dictionary_size)}
+    codes = []
+    word = b''
+    for byte in data:
+        candidate = word + bytes([byte])
+        if candidate in dictionary:
+            word = candidate
+        else:
+            codes.append(dictionary[word])
+            if len(dictionary) < max_code:
+                dictionary[candidate] = len(dictionary)
+            word = bytes([byte])
+    codes.append(dictionary[word])
+    return codes
+
+def codes_to_bytes(codes, nr=10):
+    '''
+        packs nr-bit codes (most significant bit first) into bytes, padding the last byte with zeros
+    '''
+    bits = ''.join(format(code, f'0{nr}b') for code in codes)
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+def XLI_encode_lead(samples):
+    '''
+        encodes 5500 int16 samples as one XLI chunk (header + 10-bit LZW codes), the inverse of one XLI_decode step
+    '''
+    z = np.asarray(samples, dtype=np.int64)
+    assert len(z) == 5500
+    # second-order deltas: z[i] = 2 z[i-1] - z[i-2] - code[i], with code[2] stored in the header
+    codes = 2 * z[1:-1] - z[:-2] - z[2:]
+    deltas = np.zeros(5500, dtype=np.int64)
+    deltas[:2] = z[:2]
+    deltas[2:-1] = codes[1:] + 64
+    deltas = deltas.astype(np.uint16)
+    # high bytes first, then low bytes
+    data = np.concatenate([deltas >> 8, deltas & 0xFF]).astype(np.uint8).tobytes()
+    chunk = codes_to_bytes(LZW_compress(data))
+    header = np.array([len(chunk)], dtype=np.int32).tobytes() + np.array([0, codes[0]], dtype=np.int16).tobytes()
+    return header + chunk
+
+def synthetic_leads(n_leads=16, seed=0):
+    '''
+        smooth int16 signals of 5500 samples, last 4 leads empty as in Philips exports
+    '''
+    rng = np.random.default_rng(seed)
+    t = np.arange(5500) / 500
+    leads = []
+    for idx in range(n_leads):
+        if idx >= 12:
+            leads.append(np.zeros(5500, dtype=np.int16))
+            continue
+        wave = 400 * np.sin(2 * np.pi * 1.2 * t + idx) + 50 * np.sin(2 * np.pi * 7 * t) + rng.normal(0, 3, 5500)
+        leads.append(np.round(wave).astype(np.int16))
+    return leads
+
+def synthetic_xli(n_leads=16, seed=0):
+    '''
+        base64 XLI payload of a 'parsedwaveforms' node
+    '''
+    return base64.b64encode(b''.join(XLI_encode_lead(lead) for lead in synthetic_leads(n_leads, seed)))
+
+def expected_XLI_output(leads):
+    '''
+        output of xml_module.XLI_decode for the payload of the given leads (limb leads III, aVR, aVL, aVF are derived)
+    '''
+    output = np.array(leads, dtype=float)
+    output[2] = output[1] - output[0] - output[2]
+    output[3] = -output[3] - (output[0] + output[1]) / 2
+    output[4] = (output[0] - output[2]) / 2 - output[4]
+    output[5] = (output[1] + output[2]) / 2 - output[5]
+    return output
+
+def synthetic_xml(path, seed=0):
+    '''
+        writes a Philips xml file and returns (waves, header) expected from xml_module.extract_xml
+    '''
+    header = {'study_date': '2014-05-29', 'study_time': '08:54:41', 'patient_id': str(10000 + seed),
+              'gender': ['Male', 'Female'][seed % 2], 'age': str(20 + seed % 70)}
+    payload = synthetic_xli(seed=seed).decode()
+    with open(path, 'w') as file:
+        file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<restingecgdata xmlns="http://www3.medical.philips.com">'
+            f'<dataacquisition date="{header["study_date"]}" time="{header["study_time"]}"/>'
+            '<patient><generalpatientdata>'
+            f'<patientid>{header["patient_id"]}</patientid><sex>{header["gender"]}</sex>'
+            f'<age><years>{header["age"]}</years></age>'
+            '</generalpatientdata></patient>'
+            f'<waveforms><parsedwaveforms>{payload}</parsedwaveforms></waveforms>'
+            '</restingecgdata>\n'
+        )
+    header['file_name'] = os.path.basename(path)
+    return expected_XLI_output(synthetic_leads(seed=seed))[:12], header
+
+def write_fixtures(directory, n_pdf=0, n_xml=0, profile='S_3x4+1_500'):
+    '''
+        writes n_pdf pdfs and n_xml xml files to directory, returns {path: expected output}
+    '''
+    os.makedirs(directory, exist_ok=True)
+    expected = {}
+    for seed in range(n_pdf):
+        path = os.path.join(directory, f'ecg_{seed:05d}.pdf')
+        expected[path] = synthetic_pdf(path, profile, seed)
+    for seed in range(n_xml):
+        path = os.path.join(directory, f'ecg_{seed:05d}.xml')
+        expected[path] = synthetic_xml(path, seed)
+    return expected
@@ -4,9 +4,25 @@
     - made a few changes (marked with #CHANGE)
 '''
 
+import os
+import time
 import numpy as np
 import base64
 import xml.etree.ElementTree as et
+from batch_module import iter_records, stage
+from file_module import iter_files
+
+# header elements read by 'read_xml_SNUB' (tag -> key), the first occurrence of each is kept
+HEADER_TAGS = {
+    'patientid': 'patient_id',
+    'sex': 'gender',
+    'years': 'age',
+}
+# attributes of <dataacquisition> read by 'read_xml_SNUB'
+ACQUISITION_ATTRIBUTES = {
+    'date': 'study_date',
+    'time': 'study_time',
+}
 
 def bytearray_to_bitarray(bytesarray):
     output = []
@@ -38,6 +54,16 @@ def bitarray_to_intarray(bitarray, nr=8):
         
     return output
 
+def bytes_to_codes(chunk, nr=10):
+    '''
+    vectorized version of bitarray_to_intarray(bytearray_to_bitarray(chunk), nr)
+    splits the bits of chunk (most significant first) into nr-bit codes, dropping the incomplete last code
+    '''
+    bits = np.unpackbits(np.frombuffer(chunk, dtype=np.uint8))
+    n_codes = len(bits) // nr
+    bits = bits[:n_codes * nr].reshape(n_codes, nr)
+    return bits.dot(1 << np.arange(nr - 1, -1, -1)).astype(np.uint16)
+
 # LZW decompressor for 'parsedwaveforms' in .xml file
 def LZW_decompress(compressed, dictionary_size=256):
     
@@ -66,6 +92,55 @@ def LZW_decompress(compressed, dictionary_size=256):
 #     print(result)
     return [ord(item) for item in result]
 
+def LZW_decode(codes, output_size=11000, dictionary_size=256):
+    '''
+    single pass version of LZW_decompress returning exactly output_size bytes (uint8 array)
+    - dictionary entries are kept as (start, length) slices of the output decoded so far
+    - decoding stops once output_size bytes are decoded, so trailing padding codes are ignored
+    '''
+    output = bytearray(output_size)
+    entry_starts, entry_lengths = [], []
+
+    output[0] = codes[0]
+    pos = 1
+    old_start, old_length = 0, 1
+
+    for code in codes[1:]:
+        if pos == output_size:
+            break
+        code = int(code)
+        if code < dictionary_size:
+            length = 1
+        elif code - dictionary_size < len(entry_starts):
+            start, length = entry_starts[code - dictionary_size], entry_lengths[code - dictionary_size]
+        elif code - dictionary_size == len(entry_starts):
+            # code being defined: old string followed by its own first byte
+            start, length = old_start, old_length + 1
+        else:
+            raise ValueError(f'invalid LZW code {code} at output position {pos}')
+
+        if pos + length > output_size:
+            raise ValueError(f'LZW output exceeds {output_size} bytes')
+
+        if code < dictionary_size:
+            output[pos] = code
+        elif start + length <= pos:
+            output[pos:pos + length] = output[start:start + length]
+        else: # the slice overlaps the string being written
+            output[pos:pos + length - 1] = output[start:pos]
+            output[pos + length - 1] = output[start]
+
+        # new entry: old string followed by the first byte of the current one, which directly follows it in the output
+        entry_starts.append(old_start)
+        entry_lengths.append(old_length + 1)
+        old_start, old_length = pos, length
+        pos += length
+
+    if pos != output_size:
+        raise ValueError(f'LZW output has {pos} bytes instead of {output_size}')
+
+    return np.frombuffer(output, dtype=np.uint8)
+
 def delta_decompression(deltas, first):
 
     x = deltas[0]
@@ -82,6 +157,22 @@ def delta_decompression(deltas, first):
         
     return output
 
+def delta_decode(deltas, first):
+    '''
+    vectorized version of delta_decompression (same int16 wrap-around), returns an int16 array
+    z[i] = 2 z[i-1] - z[i-2] - code[i] where code[2] = first and code[i] = deltas[i-1] - 64,
+    i.e. the first differences z[i] - z[i-1] are a running sum of -code
+    '''
+    deltas = np.asarray(deltas, dtype=np.int64)
+    codes = np.empty(len(deltas) - 2, dtype=np.int64)
+    codes[0] = first
+    codes[1:] = deltas[2:-1] - 64
+
+    output = np.empty(len(deltas), dtype=np.int64)
+    output[:2] = deltas[:2]
+    output[2:] = deltas[1] + np.cumsum((deltas[1] - deltas[0]) - np.cumsum(codes))
+    return output.astype(np.int16)
+
 def XLI_decode(compressed_b64):
         
     output = []
@@ -101,36 +192,17 @@ def XLI_decode(compressed_b64):
 #         print('delta:', delta_code, header[6:])
 #         print("Lengths:", len(chunk), len(compressed_bytes))
 
-        bitarray = bytearray_to_bitarray(chunk)
-        byte10_array = bitarray_to_intarray(bitarray, 10)
-        
-        cut_idx = 0
-        decomp = 11111 * [0]
+        byte10_array = bytes_to_codes(chunk, 10)
         
-        while len(decomp)!=11000: 
-            try:
-                decomp = LZW_decompress([chr(i) for i in byte10_array[:len(byte10_array)-cut_idx]], 256)
-                if len(decomp) != 11000:
-                    raise ValueError
-            except:
-                cut_idx += 1
-                if len(decomp) < 11000:
-                    print(len(decomp))
-                    raise ValueError
+        decomp = LZW_decode(byte10_array, 11000)
         
-        # unroll delta
-        unrolled_delta = []
-        for idx in range(5500):
-            unrolled_delta.append(
-                np.frombuffer(
-                    bytearray([decomp[5500+idx], decomp[idx]]), dtype=np.int16
-                )[0]
-            ) 
+        # unroll delta: high bytes in the first half, low bytes in the second half
+        unrolled_delta = (decomp[:5500].astype(np.uint16) << 8 | decomp[5500:]).view(np.int16)
         
         # decode delta
-        unrolled_delta = delta_decompression(unrolled_delta, delta_code)
-            
-        output.append(np.array(unrolled_delta, dtype='float64'))
+        output.append(delta_decode(unrolled_delta, delta_code))
+
+    output = np.array(output, dtype='float64')
         
     # Lead Order : I, II, III, aVR, aVL, aVF, V1, V2, V3, V4, V5, V6
     # Length of 'output' = 16
@@ -145,19 +217,101 @@ def XLI_decode(compressed_b64):
     
     return output
     
+def read_xml_SNUB(xml_path):
+    '''
+    streams the xml file once and returns the text of the last root -> waveforms -> parsedwaveforms node
+    together with the header metadata (see HEADER_TAGS, ACQUISITION_ATTRIBUTES)
+    - processed elements are cleared, so the whole document is never kept in memory
+    '''
+    header = {}
+    wave_text = None
+    parents = []
+    for event, el in et.iterparse(xml_path, events=('start', 'end')):
+        tag = el.tag.split('}')[-1]
+        if event == 'start':
+            if tag == 'dataacquisition':
+                for attribute, key in ACQUISITION_ATTRIBUTES.items():
+                    if attribute in el.attrib:
+                        header.setdefault(key, el.attrib[attribute])
+            parents.append(el)
+            continue
+
+        parents.pop()
+        if tag == 'parsedwaveforms' and len(parents) == 2 and parents[1].tag.split('}')[-1] == 'waveforms':
+            wave_text = el.text
+        elif tag in HEADER_TAGS and el.text:
+            header.setdefault(HEADER_TAGS[tag], el.text.strip())
+        el.clear()
+        if parents:
+            parents[-1].remove(el)
+
+    return wave_text, header
+
 def waves_from_xml_file_SNUB(xml_path):
-    xmlns = 'http://www3.medical.philips.com'
-    xml = et.parse(xml_path)
     '''
-        #CHANGE: changed code for finding wave_node (three lines of code below)
+        #CHANGE: the xml file is streamed (see 'read_xml_SNUB') instead of parsed as a whole
         xml structure: (arrow denotes child element)
             root -> waveforms -> parsedwaveforms
     '''
-    root = xml.getroot() 
-    waveforms = root.findall('{' + xmlns + '}' + 'waveforms')[-1]
-    wave_node = waveforms.findall('{' + xmlns + '}' + 'parsedwaveforms')[-1]
+    wave_text, _ = read_xml_SNUB(xml_path)
+
+    # Check whether a node for waves was found
+    assert(wave_text is not None)
+
+    return XLI_decode(wave_text)[:12]
+
+def extract_xml(xml_path):
+    '''
+    returns (waves, header) of a single xml file
+    '''
+    with stage('read'):
+        wave_text, header = read_xml_SNUB(xml_path)
+        assert(wave_text is not None)
+    header['file_name'] = os.path.basename(xml_path)
+    with stage('decode'):
+        waves = XLI_decode(wave_text)[:12]
+    return waves, header
+
+def xml_file_paths(directory, pattern=None, shard=None):
+    return list(iter_files(directory, ('.xml',), pattern, shard=shard))
+
+def iter_waves_and_headers_xml(directory, workers=None, chunksize=4, max_in_flight=None, ordered=True, on_error='record',
+                               manifest=None, resume=False, pattern=None, shard=None, stats=None):
+    '''
+    iterator version of 'waves_and_headers_xml' (same arguments)
+    yields (xml_path, waves, header, status) for each xml as soon as it is decoded, where status is
+    'ok' or 'error' (only with on_error='record'; waves is None and header is the error record {'stage', 'reason'})
+    - on_error, manifest, resume, stats: see batch_module.iter_records
+    '''
+    xml_paths = iter_files(directory, ('.xml',), pattern, shard=shard)
+    records = iter_records(extract_xml, xml_paths, workers, chunksize, max_in_flight, ordered, on_error,
+                           manifest=manifest, resume=resume, stats=stats)
+
+    for xml_path, status, result in records:
+        if status == 'ok':
+            waves, header = result
+        else:
+            waves, header = None, result
+        yield xml_path, waves, header, status
+
+def waves_and_headers_xml(directory, workers=None, chunksize=4, max_in_flight=None, ordered=True, on_error='record',
+                          manifest=None, resume=False, pattern=None, shard=None, stats=None):
+    '''
+    input : directory that contains n-xmls (searched recursively)
+    output : list of waves (12, 5500), headers of the xmls decoded, and the throughput (files/s)
+    - workers, chunksize, max_in_flight, ordered: see batch_module.imap_bounded (workers=1 runs serially)
+    - on_error, manifest, resume, stats: fault tolerant / resumable batches (see batch_module.iter_records),
+      failed xmls are left out of the output (recorded in stats['failures'] and the manifest)
+    - pattern, shard: see file_module.iter_files
+    '''
+    waves, headers = [], []
 
-    # Check whether wave_node is a right node for waves
-    assert(wave_node.tag.split('}')[-1] == 'parsedwaveforms') #CHANGE: changed if statement with raise error to assert statement
+    start = time.perf_counter()
+    for _, wave, header, status in iter_waves_and_headers_xml(directory, workers, chunksize, max_in_flight, ordered,
+                                                              on_error, manifest, resume, pattern, shard, stats):
+        if status == 'ok':
+            waves.append(wave)
+            headers.append(header)
+    elapsed = time.perf_counter() - start
 
-    return XLI_decode(wave_node.text)[:12]
\ No newline at end of file
+    return waves, headers, len(waves) / max(elapsed, 1e-9)